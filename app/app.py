@@ -1,48 +1,126 @@
+import atexit
+import json
+import logging
+import os
+
 import dash
-from dash import Dash, dcc, html
-from dash.dependencies import Input, Output
+from dash import Dash, Patch, ctx, dcc, html
+from dash.dependencies import ClientsideFunction, Input, Output, State
 import plotly.express as px
+import numpy as np
 import pandas as pd
-import os
-import pandas as pd
-from databricks.sql import connect
-
-
-DATBRICKS_API_KEY = os.getenv("DATABRICKS_API_KEY")
-DATABRICKS_SERVER = os.getenv("DATABRICKS_SERVER")
-DATABRICKS_HTTP_PATH = os.getenv("DATABRICKS_HTTP_PATH")
-
-query = "SELECT * FROM brz_dev.dbdemos.colombian_temperature_data"
-
-
-def query_to_dataframe(query: str) -> pd.DataFrame:
-    with connect(
-        server_hostname=DATABRICKS_SERVER,
-        http_path=DATABRICKS_HTTP_PATH,
-        access_token=DATBRICKS_API_KEY,
-    ) as connection:
-        with connection.cursor() as cursor:
-            cursor.execute(query)
-            rows = cursor.fetchall()
-            column_names = [desc[0] for desc in cursor.description]
- 
-    return pd.DataFrame(rows, columns=column_names)
-
-# Load your data
-
-df = query_to_dataframe(query)
-df['date'] = pd.to_datetime(df['date'])  # Ensure 'date' column is datetime type
-df["departamento"]=df["departamento"].str.strip()
-df["departamento"]=df["departamento"].str.replace("SAN ANDRES Y  PROVIDENCIA","SAN ANDRES Y PROVIDENCIA")
-df["municipio"]=df["municipio"].str.strip()
-
-
-def select_municipio(df,municipio):
-    df=df[df["municipio"]==municipio].\
-    groupby(["date"])[["temp_min","temp_avg","temp_max"]].mean().reset_index().sort_values(by="date",ascending=False).reset_index(drop=True)
-    return df
-
-def monthly_evolution_of_temperature_per_municipio(df, departamento, municipio, min_date, max_date, variable):
+from flask import Response, jsonify
+
+from datasource import source_from_env
+from dataset import LiveDataset, Refresher, catalog_refresh, follow_snapshot, incremental_refresh, start, start_shared
+from metrics import CONTENT_TYPE, REGISTRY, Counter, Gauge
+from instrument import instrumented, lap
+from warehouse import WarehouseDataset
+from frames import compact_json, cumulative_frames, epoch_ms, single_frame, typed_array
+from cache import cache_from_env
+from downsample import METHODS as DOWNSAMPLE_METHODS, downsample
+from export import export_blueprint
+from prefetch import Prefetcher, SelectionLog
+
+
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"))
+
+# Figures served by update_graph, keyed by data version and selection
+figure_cache = cache_from_env()
+
+# Compact figures (the default) carry the series once and the browser builds
+# the animation frames from it; WEATHER_FIGURE_ENCODING=full sends them all.
+compact_figures = os.getenv("WEATHER_FIGURE_ENCODING", "compact") != "full"
+animation_frames = single_frame if compact_figures else cumulative_frames
+
+# Unit of each variable, for titles, axes and hover labels
+UNITS = {"temp_max": "°C", "temp_avg": "°C", "temp_min": "°C", "precipitacion_total": "mm"}
+
+# Limits of the departamento view: the municipios with the most data, and the
+# latest periods that fit in the cell budget, so big departamentos stay light.
+heatmap_max_municipios = int(os.getenv("WEATHER_HEATMAP_MAX_MUNICIPIOS", "60"))
+heatmap_max_cells = int(os.getenv("WEATHER_HEATMAP_MAX_CELLS", "20000"))
+
+# Longer series are reduced to this many points before plotting (0 disables):
+# WEATHER_DOWNSAMPLE=minmax keeps each bucket's extremes, lttb its shape.
+point_budget = int(os.getenv("WEATHER_POINT_BUDGET", "1500"))
+downsample_method = os.getenv("WEATHER_DOWNSAMPLE", "minmax")
+if downsample_method not in DOWNSAMPLE_METHODS:
+    raise ValueError(f"WEATHER_DOWNSAMPLE must be one of {', '.join(DOWNSAMPLE_METHODS)}")
+
+# Load your data: from the local snapshot when there is one, refreshed in the background.
+# With WEATHER_QUERY_MODE=pushdown the table stays in the warehouse and each
+# chart is aggregated there instead.
+source = source_from_env()
+live = LiveDataset()
+live.subscribe(lambda dataset: figure_cache.invalidate(dataset.version))
+pushdown = os.getenv("WEATHER_QUERY_MODE", "memory") == "pushdown"
+snapshot_dir = os.getenv("WEATHER_SNAPSHOT_DIR") or None
+
+# Figures built in the background: after each publish, the default selection
+# and the WEATHER_WARMUP_SELECTIONS most requested ones (counted in
+# WEATHER_SELECTION_LOG, next to the snapshot by default); after a
+# departamento is picked, up to WEATHER_PREFETCH_MUNICIPIOS of its municipios.
+# WEATHER_PREFETCH_WORKERS=0 disables both.
+selection_log = SelectionLog(os.getenv("WEATHER_SELECTION_LOG")
+                             or (os.path.join(snapshot_dir, "selections.json") if snapshot_dir else None))
+atexit.register(selection_log.save)
+prefetcher = Prefetcher(workers=int(os.getenv("WEATHER_PREFETCH_WORKERS", "1")),
+                        max_pending=int(os.getenv("WEATHER_PREFETCH_QUEUE", "64")))
+warmup_selections = int(os.getenv("WEATHER_WARMUP_SELECTIONS", "20"))
+prefetch_municipios = int(os.getenv("WEATHER_PREFETCH_MUNICIPIOS", "24"))
+refresh_on_start = os.getenv("WEATHER_REFRESH_ON_START", "1") != "0"
+# Under gunicorn (see gunicorn.conf.py) every worker maps the same snapshot
+# and only one of them, the leader, refreshes it.
+shared = not pushdown and snapshot_dir is not None and os.getenv("WEATHER_SHARED_SNAPSHOT", "0") == "1"
+leader = True
+if pushdown:
+    live.publish(WarehouseDataset(source))
+elif shared:
+    leader = start_shared(live, source, snapshot_dir, refresh=refresh_on_start)
+else:
+    start(live, source, snapshot_dir=snapshot_dir, refresh=refresh_on_start)
+
+# Pick up new observations every WEATHER_REFRESH_MINUTES (0 disables)
+refresh_minutes = float(os.getenv("WEATHER_REFRESH_MINUTES", "60"))
+if refresh_minutes > 0 and leader:
+    refresher = Refresher(live, source, interval=refresh_minutes * 60, snapshot_dir=snapshot_dir,
+                          refresh=catalog_refresh if pushdown else incremental_refresh).start()
+
+# Workers sharing a snapshot map each new one within WEATHER_SNAPSHOT_POLL_SECONDS
+if shared:
+    follower = Refresher(live, source, interval=float(os.getenv("WEATHER_SNAPSHOT_POLL_SECONDS", "15")),
+                         snapshot_dir=snapshot_dir, refresh=follow_snapshot).start()
+
+
+# Shared by the four charts and by the partial updates of update_graph
+def evolution_title(aggregation_level, variable, departamento, municipio, min_date, max_dates, note=None):
+    labels_vars = {
+        "temp_max": "Temperatura máxima",
+        "temp_avg": "Temperatura promedio",
+        "temp_min": "Temperatura mínima",
+        "precipitacion_total": "Precipitación total"
+    }
+    labels_aggregation = {'D': 'Diario', 'W': 'Semanal', 'M': 'Mensual', 'Q': 'Trimestral', 'A': 'Anual'}
+    title = (f'Evolución de promedio de {labels_vars[variable]}({UNITS[variable]}) {labels_aggregation[aggregation_level]} de '
+             f'{municipio.capitalize()}, {departamento.capitalize()} entre {min_date} y {max_dates}')
+    if note:
+        title += f"<br><sup>{note}</sup>"
+    return title
+
+
+def budgeted_series(cube, aggregation_level, departamento, municipio, variable, min_date, max_date):
+    """The series of one chart within the point budget, and a note for the title if it was reduced."""
+    df_temp = cube.series(aggregation_level, departamento, municipio, variable, min_date, max_date)
+    lap("series", rows=len(df_temp))
+    reduced = downsample(df_temp, variable, point_budget, downsample_method)
+    if len(reduced) == len(df_temp):
+        return df_temp, None
+    lap("downsample", rows=len(reduced))
+    return reduced, f'{len(reduced)} de {len(df_temp)} puntos ({downsample_method}); acote las fechas para verlos todos'
+
+
+def monthly_evolution_of_temperature_per_municipio(cube, departamento, municipio, min_date, max_date, variable):
     labels_vars = {
         "temp_max": "Temperatura máxima",
         "temp_avg": "Temperatura promedio",
@@ -50,18 +128,8 @@ def monthly_evolution_of_temperature_per_municipio(df, departamento, municipio,
         "precipitacion_total": "Precipitación total"
     }
 
-    df_temp = select_municipio(df, municipio)
-
-    df_temp.set_index('date', inplace=True)
-
-    # Resample data to get mean values per month and round to 1 decimal
-    df_temp = df_temp.resample('M').mean().round(1)
-
-    # Reset index to have 'date' as a regular column
-    df_temp.reset_index(inplace=True)
-
-    df_temp = df_temp[(df_temp[variable] >= 0) & (df_temp[variable] <= 45) & (df_temp["date"] >= pd.to_datetime(min_date)) & (df_temp["date"] <= pd.to_datetime(max_date))]
-    df_temp['id'] = range(len(df_temp))
+    # Valid monthly means, rounded to 1 decimal, from the precomputed rollups, within the point budget
+    df_temp, note = budgeted_series(cube, 'M', departamento, municipio, variable, min_date, max_date)
 
      # Check if df_temp is empty
     if df_temp.empty:
@@ -69,27 +137,16 @@ def monthly_evolution_of_temperature_per_municipio(df, departamento, municipio,
     else:
         max_dates = df_temp["date"].max().strftime("%Y-%m-%d")
 
-    frames = []
-    for i in range(len(df_temp)):
-        frame = df_temp[df_temp['id'] <= i].copy()
-        frame['frame'] = i
-        frames.append(frame)
-        
-    # Check if frames is not empty before concatenation
-    if frames:
-        animated_df = pd.concat(frames)
-    else:
-        # Handling the case where frames is empty
-        # Create an empty DataFrame with necessary columns for plotly to avoid error
-        animated_df = pd.DataFrame(columns=['date', variable, 'id', 'frame'])
+    animated_df = animation_frames(df_temp)
+    lap("frames", rows=len(animated_df))
 
 
     if animated_df.empty:
         fig = px.scatter(title=f'Sin datos disponibles para {municipio.capitalize()}, {departamento.capitalize()} entre {min_date} y {max_dates}')
     else:
         fig = px.scatter(animated_df, x='date', y=variable, 
-                         title=f'Evolución de promedio de {labels_vars[variable]}(°C) Mensual de {municipio.capitalize()}, {departamento.capitalize()} entre {min_date} y {max_dates}',
-                         labels= {variable: "°C", 'date': 'Fecha'},
+                         title=f'Evolución de promedio de {labels_vars[variable]}({UNITS[variable]}) Mensual de {municipio.capitalize()}, {departamento.capitalize()} entre {min_date} y {max_dates}',
+                         labels= {variable: UNITS[variable], 'date': 'Fecha'},
                          animation_frame='frame',
                          size=variable,
                          size_max=20,
@@ -110,7 +167,7 @@ def monthly_evolution_of_temperature_per_municipio(df, departamento, municipio,
                                             method='animate',
                                             args=[[None], dict(frame=dict(duration=0, redraw=True), mode='immediate', transition=dict(duration=0))])])],
             #height=500,  # Set the height of the plot here. Adjust the value as needed.
-            title=dict(text=f'Evolución de promedio de {labels_vars[variable]}(°C) Mensual de {municipio.capitalize()}, {departamento.capitalize()} entre {min_date} y {max_dates}',
+            title=dict(text=evolution_title('M', variable, departamento, municipio, min_date, max_dates, note),
                        x=0.5,  # Center the title
                        xanchor='center',  # Use 'center' to center
                        font=dict(size=20)  # Adjust the font size here
@@ -122,45 +179,83 @@ def monthly_evolution_of_temperature_per_municipio(df, departamento, municipio,
         #fig.show()
     return fig
 
-def weekly_evolution_of_temperature_per_municipio(df, departamento, municipio, min_date, max_date, variable):
+def daily_evolution_of_temperature_per_municipio(cube, departamento, municipio, min_date, max_date, variable):
     labels_vars = {
         "temp_max": "Temperatura máxima",
         "temp_avg": "Temperatura promedio",
-        "temp_min": "Temperatura mínima"
+        "temp_min": "Temperatura mínima",
+        "precipitacion_total": "Precipitación total"
     }
 
-    df_temp = select_municipio(df, municipio)
+    # Valid daily means, rounded to 1 decimal, averaged from the stations' rows, within the point budget
+    df_temp, note = budgeted_series(cube, 'D', departamento, municipio, variable, min_date, max_date)
 
-    df_temp.set_index('date', inplace=True)
+    if df_temp.empty:
+        max_dates = max_date  # Use the user-specified max_date as a fallback
+    else:
+        max_dates = df_temp["date"].max().strftime("%Y-%m-%d")
 
-    # Resample data to get mean values per week and round to 1 decimal
-    df_temp = df_temp.resample('W-Mon').mean().round(1)
+    animated_df = animation_frames(df_temp)
+    lap("frames", rows=len(animated_df))
 
-    # Reset index to have 'date' as a regular column
-    df_temp.reset_index(inplace=True)
+    if animated_df.empty:
+        fig = px.scatter(title=f'Sin datos disponibles para {municipio.capitalize()}, {departamento.capitalize()} entre {min_date} y {max_dates}')
+    else:
+        fig = px.scatter(animated_df, x='date', y=variable, 
+                         title=f'Evolución de promedio de {labels_vars[variable]}({UNITS[variable]}) Diario de {municipio.capitalize()}, {departamento.capitalize()} entre {min_date} y {max_dates}',
+                         labels={variable: UNITS[variable], 'date': 'Fecha'},
+                         animation_frame='frame',
+                         size=variable,
+                         size_max=20,
+                         color=variable,
+                         color_continuous_scale=px.colors.diverging.Portland,
+                         opacity=0.7)
+
+        fig.update_layout(
+            updatemenus=[{
+                'type': 'buttons', 
+                'showactive': False, 
+                'buttons': [
+                    {'label': 'Play', 'method': 'animate', 'args': [None, {'frame': {'duration': 50, 'redraw': True}, 'fromcurrent': True}]},
+                    {'label': 'Pause', 'method': 'animate', 'args': [[None], {'frame': {'duration': 0, 'redraw': True}, 'mode': 'immediate', 'transition': {'duration': 0}}]}
+                ]
+            }],
+            #height=500,
+            title={
+                'text': evolution_title('D', variable, departamento, municipio, min_date, max_dates, note),
+                'x': 0.5, 'xanchor': 'center', 'font': {'size': 20}
+            }
+        )
+        # Spans go from a few days to decades, so the ticks are left to plotly
+        fig.update_xaxes(type='date', tickformat='%Y-%m-%d', title_text='Fecha', tickangle=45)
+
+    return fig
+
+def weekly_evolution_of_temperature_per_municipio(cube, departamento, municipio, min_date, max_date, variable):
+    labels_vars = {
+        "temp_max": "Temperatura máxima",
+        "temp_avg": "Temperatura promedio",
+        "temp_min": "Temperatura mínima",
+        "precipitacion_total": "Precipitación total"
+    }
 
-    df_temp = df_temp[(df_temp[variable] >= 0) & (df_temp[variable] <= 45) & (df_temp["date"] >= pd.to_datetime(min_date)) & (df_temp["date"] <= pd.to_datetime(max_date))]
-    df_temp['id'] = range(len(df_temp))
+    # Valid weekly means, rounded to 1 decimal, from the precomputed rollups, within the point budget
+    df_temp, note = budgeted_series(cube, 'W', departamento, municipio, variable, min_date, max_date)
 
     if df_temp.empty:
         max_dates = max_date  # Use the user-specified max_date as a fallback
     else:
         max_dates = df_temp["date"].max().strftime("%Y-%m-%d")
 
-    frames = []
-    for i in range(len(df_temp)):
-        frame = df_temp[df_temp['id'] <= i].copy()
-        frame['frame'] = i
-        frames.append(frame)
-        
-    animated_df = pd.concat(frames) if frames else pd.DataFrame(columns=['date', variable, 'id', 'frame'])
+    animated_df = animation_frames(df_temp)
+    lap("frames", rows=len(animated_df))
 
     if animated_df.empty:
         fig = px.scatter(title=f'Sin datos disponibles para {municipio.capitalize()}, {departamento.capitalize()} entre {min_date} y {max_dates}')
     else:
         fig = px.scatter(animated_df, x='date', y=variable, 
-                         title=f'Evolución de promedio de {labels_vars[variable]}(°C) Semanal de {municipio.capitalize()}, {departamento.capitalize()} entre {min_date} y {max_dates}',
-                         labels={variable: "°C", 'date': 'Fecha'},
+                         title=f'Evolución de promedio de {labels_vars[variable]}({UNITS[variable]}) Semanal de {municipio.capitalize()}, {departamento.capitalize()} entre {min_date} y {max_dates}',
+                         labels={variable: UNITS[variable], 'date': 'Fecha'},
                          animation_frame='frame',
                          size=variable,
                          size_max=20,
@@ -179,7 +274,7 @@ def weekly_evolution_of_temperature_per_municipio(df, departamento, municipio, m
             }],
             #height=500,
             title={
-                'text': f'Evolución de promedio de {labels_vars[variable]}(°C) Semanal de {municipio.capitalize()}, {departamento.capitalize()} entre {min_date} and {max_dates}',
+                'text': evolution_title('W', variable, departamento, municipio, min_date, max_dates, note),
                 'x': 0.5, 'xanchor': 'center', 'font': {'size': 20}
             }
         )
@@ -188,45 +283,31 @@ def weekly_evolution_of_temperature_per_municipio(df, departamento, municipio, m
 
     return fig
 
-def quarterly_evolution_of_temperature_per_municipio(df, departamento, municipio, min_date, max_date, variable):
+def quarterly_evolution_of_temperature_per_municipio(cube, departamento, municipio, min_date, max_date, variable):
     labels_vars = {
         "temp_max": "Temperatura máxima",
         "temp_avg": "Temperatura promedio",
-        "temp_min": "Temperatura mínima"
+        "temp_min": "Temperatura mínima",
+        "precipitacion_total": "Precipitación total"
     }
 
-    df_temp = select_municipio(df, municipio)
-
-    df_temp.set_index('date', inplace=True)
-
-    # Resample data to get mean values per quarter and round to 1 decimal
-    df_temp = df_temp.resample('Q').mean().round(1)
-
-    # Reset index to have 'date' as a regular column
-    df_temp.reset_index(inplace=True)
-
-    df_temp = df_temp[(df_temp[variable] >= 0) & (df_temp[variable] <= 45) & (df_temp["date"] >= pd.to_datetime(min_date)) & (df_temp["date"] <= pd.to_datetime(max_date))]
-    df_temp['id'] = range(len(df_temp))
+    # Valid quarterly means, rounded to 1 decimal, from the precomputed rollups, within the point budget
+    df_temp, note = budgeted_series(cube, 'Q', departamento, municipio, variable, min_date, max_date)
 
     if df_temp.empty:
         max_dates = max_date  # Use the user-specified max_date as a fallback
     else:
         max_dates = df_temp["date"].max().strftime("%Y-%m-%d")
 
-    frames = []
-    for i in range(len(df_temp)):
-        frame = df_temp[df_temp['id'] <= i].copy()
-        frame['frame'] = i
-        frames.append(frame)
-        
-    animated_df = pd.concat(frames) if frames else pd.DataFrame(columns=['date', variable, 'id', 'frame'])
+    animated_df = animation_frames(df_temp)
+    lap("frames", rows=len(animated_df))
 
     if animated_df.empty:
         fig = px.scatter(title=f'Sin datos disponibles para {municipio.capitalize()}, {departamento.capitalize()} entre {min_date} y {max_dates}')
     else:
         fig = px.scatter(animated_df, x='date', y=variable, 
-                         title=f'Evolución de promedio de {labels_vars[variable]}(°C) Trimestral de {municipio.capitalize()}, {departamento.capitalize()} entre {min_date} y {max_dates}',
-                         labels={variable: "°C", 'date': 'Fecha'},
+                         title=f'Evolución de promedio de {labels_vars[variable]}({UNITS[variable]}) Trimestral de {municipio.capitalize()}, {departamento.capitalize()} entre {min_date} y {max_dates}',
+                         labels={variable: UNITS[variable], 'date': 'Fecha'},
                          animation_frame='frame',
                          size=variable,
                          size_max=20,
@@ -245,7 +326,7 @@ def quarterly_evolution_of_temperature_per_municipio(df, departamento, municipio
             }],
             #height=500,
             title={
-                'text': f'Evolución de promedio de {labels_vars[variable]}(°C) Trimestral de {municipio.capitalize()}, {departamento.capitalize()} entre {min_date} and {max_dates}',
+                'text': evolution_title('Q', variable, departamento, municipio, min_date, max_dates, note),
                 'x': 0.5, 'xanchor': 'center', 'font': {'size': 20}
             }
         )
@@ -254,45 +335,31 @@ def quarterly_evolution_of_temperature_per_municipio(df, departamento, municipio
     
     return fig
 
-def yearly_evolution_of_temperature_per_municipio(df, departamento, municipio, min_date, max_date, variable):
+def yearly_evolution_of_temperature_per_municipio(cube, departamento, municipio, min_date, max_date, variable):
     labels_vars = {
         "temp_max": "Temperatura máxima",
         "temp_avg": "Temperatura promedio",
-        "temp_min": "Temperatura mínima"
+        "temp_min": "Temperatura mínima",
+        "precipitacion_total": "Precipitación total"
     }
 
-    df_temp = select_municipio(df, municipio)
-
-    df_temp.set_index('date', inplace=True)
-
-    # Resample data to get mean values per year and round to 1 decimal
-    df_temp = df_temp.resample('A').mean().round(1)
-
-    # Reset index to have 'date' as a regular column
-    df_temp.reset_index(inplace=True)
-
-    df_temp = df_temp[(df_temp[variable] >= 0) & (df_temp[variable] <= 45) & (df_temp["date"] >= pd.to_datetime(min_date)) & (df_temp["date"] <= pd.to_datetime(max_date))]
-    df_temp['id'] = range(len(df_temp))
+    # Valid yearly means, rounded to 1 decimal, from the precomputed rollups, within the point budget
+    df_temp, note = budgeted_series(cube, 'A', departamento, municipio, variable, min_date, max_date)
 
     if df_temp.empty:
         max_dates = max_date  # Use the user-specified max_date as a fallback
     else:
         max_dates = df_temp["date"].max().strftime("%Y-%m-%d")
 
-    frames = []
-    for i in range(len(df_temp)):
-        frame = df_temp[df_temp['id'] <= i].copy()
-        frame['frame'] = i
-        frames.append(frame)
-        
-    animated_df = pd.concat(frames) if frames else pd.DataFrame(columns=['date', variable, 'id', 'frame'])
+    animated_df = animation_frames(df_temp)
+    lap("frames", rows=len(animated_df))
 
     if animated_df.empty:
         fig = px.scatter(title=f'Sin datos disponibles para {municipio.capitalize()}, {departamento.capitalize()} entre {min_date} y {max_dates}')
     else:
         fig = px.scatter(animated_df, x='date', y=variable, 
-                         title=f'Evolución de promedio de {labels_vars[variable]}(°C) Anual de {municipio.capitalize()}, {departamento.capitalize()} entre {min_date} y {max_dates}',
-                         labels={variable: "°C", 'date': 'Fecha'},
+                         title=f'Evolución de promedio de {labels_vars[variable]}({UNITS[variable]}) Anual de {municipio.capitalize()}, {departamento.capitalize()} entre {min_date} y {max_dates}',
+                         labels={variable: UNITS[variable], 'date': 'Fecha'},
                          animation_frame='frame',
                          size=variable,
                          size_max=20,
@@ -311,7 +378,7 @@ def yearly_evolution_of_temperature_per_municipio(df, departamento, municipio, m
             }],
             #height=500,
             title={
-                'text': f'Evolución de promedio de {labels_vars[variable]}(°C) Anual de {municipio.capitalize()}, {departamento.capitalize()} entre {min_date} and {max_dates}',
+                'text': evolution_title('A', variable, departamento, municipio, min_date, max_dates, note),
                 'x': 0.5, 'xanchor': 'center', 'font': {'size': 20}
             }
         )
@@ -320,107 +387,282 @@ def yearly_evolution_of_temperature_per_municipio(df, departamento, municipio, m
     return fig
 
 
+def departamento_heatmap(cube, aggregation_level, departamento, min_date, max_date, variable):
+    labels_vars = {
+        "temp_max": "Temperatura máxima",
+        "temp_avg": "Temperatura promedio",
+        "temp_min": "Temperatura mínima",
+        "precipitacion_total": "Precipitación total"
+    }
+    labels_aggregation = {'D': 'diario', 'W': 'semanal', 'M': 'mensual', 'Q': 'trimestral', 'A': 'anual'}
+
+    # Every municipio of the departamento in one slice of the rollups
+    municipios, dates, grid = cube.departamento_grid(aggregation_level, departamento, variable, min_date, max_date)
+    lap("grid", rows=grid.size)
+
+    valid = np.count_nonzero(~np.isnan(grid), axis=1)
+    shown = np.flatnonzero(valid)
+    if not len(shown):
+        return px.scatter(title=f'Sin datos disponibles para {departamento.capitalize()} entre {min_date} y {max_date}')
+
+    notes = []
+    if len(shown) > heatmap_max_municipios:
+        shown = np.sort(shown[np.argsort(-valid[shown], kind='stable')[:heatmap_max_municipios]])
+        notes.append(f'{len(shown)} de {np.count_nonzero(valid)} municipios con más datos')
+    periods = max(1, heatmap_max_cells // len(shown))
+    if len(dates) > periods:
+        dates, grid = dates[-periods:], grid[:, -periods:]
+        min_date = pd.Timestamp(dates[0]).strftime("%Y-%m-%d")
+        notes.append(f'últimos {periods} periodos')
+    grid = grid[shown]
+    max_dates = pd.Timestamp(dates[-1]).strftime("%Y-%m-%d")
+
+    title = (f'{labels_vars[variable]}({UNITS[variable]}) promedio {labels_aggregation[aggregation_level]} por municipio de '
+             f'{departamento.capitalize()} entre {min_date} y {max_dates}')
+    if notes:
+        title += f"<br><sup>{', '.join(notes)}</sup>"
+    fig = px.imshow(grid.astype(np.float32),
+                    x=dates,
+                    y=[municipios[i].capitalize() for i in shown],
+                    labels={'x': 'Fecha', 'y': 'Municipio', 'color': UNITS[variable]},
+                    color_continuous_scale=px.colors.diverging.Portland,
+                    aspect='auto')
+    fig.update_traces(hovertemplate=f'%{{y}}<br>%{{x}}<br>%{{z:.1f}} {UNITS[variable]}<extra></extra>')
+    fig.update_layout(
+        title=dict(text=title, x=0.5, xanchor='center', font=dict(size=20)),
+        height=max(450, 22 * len(shown) + 250),
+    )
+    fig.update_xaxes(type='date', title_text='Fecha', tickangle=45)
+    fig.update_yaxes(title_text=None)
+    return fig
+
+
+def anomaly_figure(cube, climatology, aggregation_level, departamento, municipio, min_date, max_date, variable):
+    labels_vars = {
+        "temp_max": "Temperatura máxima",
+        "temp_avg": "Temperatura promedio",
+        "temp_min": "Temperatura mínima",
+        "precipitacion_total": "Precipitación total"
+    }
+    labels_aggregation = {'D': 'diaria', 'W': 'semanal', 'M': 'mensual', 'Q': 'trimestral', 'A': 'anual'}
+    labels_normal = {
+        'D': 'de los días del mismo mes en otros años',
+        'W': 'de las semanas del mismo mes en otros años',
+        'M': 'del mismo mes en otros años',
+        'Q': 'del mismo trimestre en otros años',
+        'A': 'de todos los años',
+    }
+    if climatology is None:
+        return px.scatter(title='Las anomalías no están disponibles con WEATHER_QUERY_MODE=pushdown')
+
+    df_temp, note = budgeted_series(cube, aggregation_level, departamento, municipio, variable, min_date, max_date)
+    # The normal of every point is a lookup of its calendar group at this granularity
+    baseline = climatology.baseline(aggregation_level, departamento, municipio, variable, df_temp["date"])
+    normal = baseline["mean"].to_numpy()
+    df = df_temp.assign(
+        normal=normal,
+        anomaly=df_temp[variable].to_numpy() - normal,
+        z=(df_temp[variable].to_numpy() - normal) / baseline["std"].to_numpy(),
+        low=baseline["p10"].to_numpy() - normal,
+        high=baseline["p90"].to_numpy() - normal,
+    ).dropna(subset=["anomaly"])
+    lap("baseline", rows=len(df))
+    if df.empty:
+        return px.scatter(title=f'Sin datos o sin normal para {municipio.capitalize()}, {departamento.capitalize()} entre {min_date} y {max_date}')
+
+    unit = UNITS[variable]
+    max_dates = df["date"].max().strftime("%Y-%m-%d")
+    # Dates as epoch ms and float32 values travel as compact binary arrays
+    # (the x axis is shared by the bars and the band, so it goes three times)
+    df = df.astype({column: np.float32 for column in [variable, 'normal', 'anomaly', 'z', 'low', 'high']})
+    df['date'] = epoch_ms(df['date'])
+    title = (f'Anomalía {labels_aggregation[aggregation_level]} de {labels_vars[variable]}({unit}) de '
+             f'{municipio.capitalize()}, {departamento.capitalize()} entre {min_date} y {max_dates}'
+             f'<br><sup>Diferencia con la normal {labels_normal[aggregation_level]}; la banda va del percentil 10 al 90'
+             f'{"; " + note if note else ""}</sup>')
+    fig = px.bar(df, x='date', y='anomaly',
+                 color='anomaly',
+                 color_continuous_scale=px.colors.diverging.RdBu_r,
+                 color_continuous_midpoint=0,
+                 custom_data=[variable, 'normal', 'z'],
+                 labels={'anomaly': unit, 'date': 'Fecha'})
+    fig.update_traces(hovertemplate=(f'%{{x}}<br>Valor: %{{customdata[0]:.1f}} {unit}<br>Normal: %{{customdata[1]:.1f}} {unit}'
+                                     f'<br>Anomalía: %{{y:+.1f}} {unit} (%{{customdata[2]:+.1f}} σ)<extra></extra>'))
+    band = dict(mode='lines', line=dict(width=0), hoverinfo='skip', showlegend=False)
+    fig.add_scatter(x=df['date'], y=df['low'], **band)
+    fig.add_scatter(x=df['date'], y=df['high'], fill='tonexty', fillcolor='rgba(128, 128, 128, 0.2)', **band)
+    fig.update_layout(
+        title=dict(text=title, x=0.5, xanchor='center', font=dict(size=20)),
+        bargap=0,
+    )
+    fig.update_xaxes(type='date', title_text='Fecha', tickangle=45)
+    fig.update_yaxes(title_text=f'Anomalía ({unit})', zeroline=True)
+    return fig
+
 
 app = dash.Dash(__name__)
 
 server=app.server
 
-# Define the app layout
-app.layout = html.Div([
-    html.H1("Evolución de temperatura en municipios de Colombia.",style={'marginLeft': '30px', 'textAlign': 'left'}),
-    html.Div([
-        html.P(["Explore la evolución de la temperatura en los municipios de Colombia. Desarrollado con datos del IDEAM por ",
-        html.A("David Alejandro López Atehortúa." , href="https://www.linkedin.com/in/davidalopeza", target="_blank"),
-        ],style={'marginLeft': '30px','marginRight': '30px', 'fontSize': '21px', 'textAlign': 'left'}),
-    ]),
 
-    html.Div([
-        html.Div([
-            html.Label("Rango de fechas:",style={'fontSize': '20px', 'marginLeft': '30px','font-weight': 'bold'}),
-            dcc.DatePickerRange(
-                id='date-picker-range',
-                min_date_allowed=df['date'].min().date(),
-                max_date_allowed=df['date'].max().date(),
-                start_date='2017-01-01',
-                end_date=df['date'].max().date(),
-                display_format='YYYY-MM-DD',
-                start_date_placeholder_text="YYYY-MM-DD",
-                end_date_placeholder_text ="YYYY-MM-DD",
-                style={'width': '290px', 'height': '10px','fontSize': '19px', 'marginLeft': '30px'},
-                clearable=False
-            ),
-        ], style={'marginTop': '10px','marginLeft': '5', 'width': '290px', 'height': '10px','display': 'inline-block'}),
-
-            # Aggregation level selection
-        html.Div([
-            html.Label("Nivel agrupación:", style={'marginLeft': '31px', 'fontSize': '20px','font-weight': 'bold'}),
-            #dcc.RadioItems(
-            dcc.Dropdown(
-                id='aggregation-level',
-                options=[
-                    #{'label': 'Semanal', 'value': 'W'},
-                    {'label': 'Mensual', 'value': 'M'},
-                    {'label': 'Trimestral', 'value': 'Q'},
-                    {'label': 'Anual', 'value': 'A'}
-                ],
-                clearable=False,
-                #inline=False,
-                value='M',  # Default selection
-                #labelStyle={'display': 'inline-block', 'marginRight': 20},
-                style={'fontSize': '19px', 'height': '30px','width': '155px','margin':'5px','marginLeft':'15px'}
-            ),
-        ],style={'marginTop': '10px','fontSize': '19px', 'height': '50px','width': '190px','marginDown':'5px','marginLeft':'15px'}),
+@server.route("/ready")
+def ready():
+    status = live.status()
+    return jsonify(status), 200 if status["ready"] else 503
+
 
+@REGISTRY.collector
+def figure_cache_metrics():
+    stats = figure_cache.stats()
+    metrics = []
+    for name in ("hits", "disk_hits", "misses", "evictions", "disk_evictions"):
+        counter = Counter(f"weather_figure_cache_{name}_total", f"Figure cache {name.replace('_', ' ')}.")
+        counter.inc(stats[name])
+        metrics.append(counter)
+    for name in ("entries", "bytes"):
+        gauge = Gauge(f"weather_figure_cache_{name}", f"Figure cache {name} held in memory.")
+        gauge.set(stats[name])
+        metrics.append(gauge)
+    return metrics
+
+
+@server.route("/metrics")
+def metrics():
+    return Response(REGISTRY.render(), content_type=CONTENT_TYPE)
+
+
+# The aggregated series behind the charts, for programmatic access
+server.register_blueprint(export_blueprint(live))
+
+
+# Define the app layout; built per page load so it follows the live dataset
+def serve_layout():
+    store = live.current.store
+    return html.Div([
+        html.H1("Evolución de temperatura en municipios de Colombia.",style={'marginLeft': '30px', 'textAlign': 'left'}),
+        html.Div([
+            html.P(["Explore la evolución de la temperatura en los municipios de Colombia. Desarrollado con datos del IDEAM por ",
+            html.A("David Alejandro López Atehortúa." , href="https://www.linkedin.com/in/davidalopeza", target="_blank"),
+            ],style={'marginLeft': '30px','marginRight': '30px', 'fontSize': '21px', 'textAlign': 'left'}),
+        ]),
 
         html.Div([
-            html.Label("Departamento:", style={'fontSize': '20px','marginLeft':'12px','font-weight': 'bold'}),
-            dcc.Dropdown(
-                id='departamento-dropdown',
-                options=[{'label': i, 'value': i} for i in df['departamento'].sort_values(ascending=True).unique()],
-                value="ANTIOQUIA",  # Default value
-                style={'width': '210px', 'height': '30px', 'marginLeft':'24px' ,'fontSize': '19px',"margin":"5px"},
-                clearable=False
-            ),
-        ], style={'marginTop': '10px','marginLeft': '10px', 'width': '210px', 'display': 'inline-block'}),
+            html.Div([
+                html.Label("Rango de fechas:",style={'fontSize': '20px', 'marginLeft': '30px','font-weight': 'bold'}),
+                dcc.DatePickerRange(
+                    id='date-picker-range',
+                    min_date_allowed=store.date_min.date(),
+                    max_date_allowed=store.date_max.date(),
+                    start_date='2017-01-01',
+                    end_date=store.date_max.date(),
+                    display_format='YYYY-MM-DD',
+                    start_date_placeholder_text="YYYY-MM-DD",
+                    end_date_placeholder_text ="YYYY-MM-DD",
+                    style={'width': '290px', 'height': '10px','fontSize': '19px', 'marginLeft': '30px'},
+                    clearable=False
+                ),
+            ], style={'marginTop': '10px','marginLeft': '5', 'width': '290px', 'height': '10px','display': 'inline-block'}),
+
+                # Aggregation level selection
+            html.Div([
+                html.Label("Nivel agrupación:", style={'marginLeft': '31px', 'fontSize': '20px','font-weight': 'bold'}),
+                #dcc.RadioItems(
+                dcc.Dropdown(
+                    id='aggregation-level',
+                    options=[
+                        {'label': 'Diario', 'value': 'D'},
+                        {'label': 'Semanal', 'value': 'W'},
+                        {'label': 'Mensual', 'value': 'M'},
+                        {'label': 'Trimestral', 'value': 'Q'},
+                        {'label': 'Anual', 'value': 'A'}
+                    ],
+                    clearable=False,
+                    #inline=False,
+                    value='M',  # Default selection
+                    #labelStyle={'display': 'inline-block', 'marginRight': 20},
+                    style={'fontSize': '19px', 'height': '30px','width': '155px','margin':'5px','marginLeft':'15px'}
+                ),
+            ],style={'marginTop': '10px','fontSize': '19px', 'height': '50px','width': '190px','marginDown':'5px','marginLeft':'15px'}),
+
+
+            html.Div([
+                html.Label("Departamento:", style={'fontSize': '20px','marginLeft':'12px','font-weight': 'bold'}),
+                dcc.Dropdown(
+                    id='departamento-dropdown',
+                    options=[{'label': i, 'value': i} for i in store.departamentos],
+                    value="ANTIOQUIA",  # Default value
+                    style={'width': '210px', 'height': '30px', 'marginLeft':'24px' ,'fontSize': '19px',"margin":"5px"},
+                    clearable=False
+                ),
+            ], style={'marginTop': '10px','marginLeft': '10px', 'width': '210px', 'display': 'inline-block'}),
         
+            html.Div([
+                html.Label("Municipio:", style={'marginLeft':'20px' ,'fontSize': '20px','font-weight': 'bold'}),
+                dcc.Dropdown(
+                    id='municipio-dropdown',
+                    # Options will be updated based on departamento selection
+                    value="MEDELLÍN",
+                    style={'width': '210px', 'height': '30px', 'margin':'5px', 'fontSize': '19px','marginLeft':'10px'},
+                    clearable=False
+                ),  
+            ], style={'marginTop': '10px','marginLeft': '10px', 'width': '210px', 'display': 'inline-block'}),
+
+
+            html.Div([
+                html.Label("Variable:",style={'marginLeft': '39px','fontSize': '20px','font-weight': 'bold'},),
+                dcc.Dropdown(
+                    id='variable-dropdown',
+                    options=[
+                        {'label': 'Temperatura Máxima', 'value': 'temp_max'},
+                        {'label': 'Temperatura Promedio', 'value': 'temp_avg'},
+                        {'label': 'Temperatura Mínima', 'value': 'temp_min'},
+                        {'label': 'Precipitación Total', 'value': 'precipitacion_total'}
+                    ],
+                    value='temp_max',  # Default value
+                    style={'width': '210px', 'height': '30px','margin': '5px','fontSize': '19px','marginLeft': '20px'},
+                    clearable=False
+                ),
+            ], style={'marginTop': '10px','marginDown': '10px','width': '210', 'display': 'inline-block','height': '65px'}),
+
+            html.Div([
+                html.Label("Vista:",style={'marginLeft': '39px','fontSize': '20px','font-weight': 'bold'},),
+                dcc.Dropdown(
+                    id='view-dropdown',
+                    options=[
+                        {'label': 'Municipio', 'value': 'municipio'},
+                        {'label': 'Todo el departamento', 'value': 'departamento'},
+                        {'label': 'Anomalía del municipio', 'value': 'anomalia'}
+                    ],
+                    value='municipio',  # Default value
+                    style={'width': '230px', 'height': '30px','margin': '5px','fontSize': '19px','marginLeft': '20px'},
+                    clearable=False
+                ),
+            ], style={'marginTop': '10px','marginDown': '10px','width': '250', 'display': 'inline-block','height': '65px'}),
+        ], style={'display': 'flex', 'flexWrap': 'wrap','flexDirection': 'row'}),
+
         html.Div([
-            html.Label("Municipio:", style={'marginLeft':'20px' ,'fontSize': '20px','font-weight': 'bold'}),
-            dcc.Dropdown(
-                id='municipio-dropdown',
-                # Options will be updated based on departamento selection
-                value="MEDELLÍN",
-                style={'width': '210px', 'height': '30px', 'margin':'5px', 'fontSize': '19px','marginLeft':'10px'},
-                clearable=False
-            ),  
-        ], style={'marginTop': '10px','marginLeft': '10px', 'width': '210px', 'display': 'inline-block'}),
+            dcc.Graph(
+                id='temperature-evolution-graph',
+                config={'responsive': True}
+            )
+        ], style={'height': 'auto'}),#, 'margin': 'auto'}),
+        #dcc.Graph(id='temperature-evolution-graph',config={'responsive': True}),
+        dcc.Store(id='figure-store'),
+        # (aggregation, departamento, municipio) of the animated figure in figure-store
+        dcc.Store(id='figure-skeleton'),
+        html.Div(id='dummy-div', style={'display': 'none'})
 
+    ])
 
-        html.Div([
-            html.Label("Variable de Temperatura:",style={'marginLeft': '39px','fontSize': '20px','font-weight': 'bold'},),
-            dcc.Dropdown(
-                id='variable-dropdown',
-                options=[
-                    {'label': 'Temperatura Máxima', 'value': 'temp_max'},
-                    {'label': 'Temperatura Promedio', 'value': 'temp_avg'},
-                    {'label': 'Temperatura Mínima', 'value': 'temp_min'}
-                ],
-                value='temp_max',  # Default value
-                style={'width': '210px', 'height': '30px','margin': '5px','fontSize': '19px','marginLeft': '20px'},
-                clearable=False
-            ),
-        ], style={'marginTop': '10px','marginDown': '10px','width': '210', 'display': 'inline-block','height': '65px'}),
-    ], style={'display': 'flex', 'flexWrap': 'wrap','flexDirection': 'row'}),
-
-    html.Div([
-        dcc.Graph(
-            id='temperature-evolution-graph',
-            config={'responsive': True}
-        )
-    ], style={'height': 'auto'}),#, 'margin': 'auto'}),
-    #dcc.Graph(id='temperature-evolution-graph',config={'responsive': True}),
-    html.Div(id='dummy-div', style={'display': 'none'})
 
-])
+app.layout = serve_layout
+
+# Compact figures from update_graph are expanded into their frames in the browser
+app.clientside_callback(
+    ClientsideFunction(namespace='figures', function_name='expand'),
+    Output('temperature-evolution-graph', 'figure'),
+    [Input('figure-store', 'data')],
+)
 
 app.clientside_callback(
     """
@@ -442,41 +684,207 @@ app.clientside_callback(
 @app.callback(
     [Output('municipio-dropdown', 'options'),
      Output('municipio-dropdown', 'value')],
-    [Input('departamento-dropdown', 'value')]
+    [Input('departamento-dropdown', 'value')],
+    [State('aggregation-level', 'value'),
+     State('date-picker-range', 'start_date'),
+     State('date-picker-range', 'end_date'),
+     State('view-dropdown', 'value')]
 )
-def set_cities_options(selected_departamento):
-    dff = df[df['departamento'] == selected_departamento]
-    municipio_options = [{'label': i, 'value': i} for i in dff['municipio'].sort_values(ascending=True).unique()]
-    default_municipio = "MEDELLÍN" if "MEDELLÍN" in dff['municipio'].values else municipio_options[0]['value']
+@instrumented("set_cities_options")
+@prefetcher.foreground
+def set_cities_options(selected_departamento, aggregation_level='M', start_date='2017-01-01', end_date=None, selected_view='municipio'):
+    data = live.current
+    store = data.store
+    municipio_options = store.municipio_options.get(selected_departamento, [])
+    default_municipio = "MEDELLÍN" if "MEDELLÍN" in store.municipios(selected_departamento) else municipio_options[0]['value']
+    lap("lookup", rows=len(municipio_options))
+
+    # The default municipio is rendered by update_graph right away; the
+    # others most likely to be picked next are built in the background.
+    # The departamento view does not change with the municipio.
+    if selected_view != 'departamento':
+        end_date = end_date or store.date_max.date().isoformat()
+        counts = selection_log.municipio_counts(selected_departamento)
+        municipios = sorted((option['value'] for option in municipio_options if option['value'] != default_municipio),
+                            key=lambda municipio: -counts[municipio])
+        for municipio in municipios[:prefetch_municipios]:
+            prefetch("departamento", data, (aggregation_level, selected_departamento, municipio, start_date, end_date, DEFAULT_SELECTION[5], selected_view))
+        lap("prefetch", rows=min(len(municipios), prefetch_municipios))
     return municipio_options, default_municipio
 
 
+# Inputs that leave the layout of the figure as it is: only its points, title and ticks change
+PATCHABLE_INPUTS = {'date-picker-range.start_date', 'date-picker-range.end_date', 'variable-dropdown.value'}
+
+
 @app.callback(
-    Output('temperature-evolution-graph', 'figure'),
+    [Output('figure-store', 'data'),
+     Output('figure-skeleton', 'data')],
     [
         Input('aggregation-level', 'value'),
         Input('departamento-dropdown', 'value'),
         Input('municipio-dropdown', 'value'),
         Input('date-picker-range', 'start_date'),
         Input('date-picker-range', 'end_date'),
-        Input('variable-dropdown', 'value')
-    ]
+        Input('variable-dropdown', 'value'),
+        Input('view-dropdown', 'value')
+    ],
+    [State('figure-skeleton', 'data')]
+)
+@instrumented("update_graph")
+@prefetcher.foreground
+def update_graph(aggregation_level,selected_departamento, selected_municipio, start_date, end_date, selected_variable, selected_view='municipio', skeleton=None):
+    data = live.current
+    record_selection(data, aggregation_level, selected_departamento, selected_municipio, start_date, end_date, selected_variable, selected_view)
+    selection = [aggregation_level, selected_departamento, selected_municipio]
+    # New dates or variable for the animated figure already in the browser: patch its arrays
+    triggered = set(ctx.triggered_prop_ids) if skeleton else set()
+    if compact_figures and skeleton == selection and triggered and PATCHABLE_INPUTS.issuperset(triggered):
+        patch = patch_figure(data.cube, aggregation_level, selected_departamento, selected_municipio, start_date, end_date, selected_variable)
+        if patch is not None:
+            return patch, dash.no_update
+
+    figure, size = cached_figure(data, aggregation_level, selected_departamento, selected_municipio, start_date, end_date, selected_variable, selected_view)
+    # The whole call on a hit; decoding the fresh JSON on a miss. The size is
+    # recorded here, not where the figure is serialized, so hits count too.
+    lap("cache", payload_bytes=size)
+    return figure, selection if "animation" in figure else None
+
+
+def figure_key(data, aggregation_level, departamento, municipio, start_date, end_date, variable, view):
+    # The departamento view is the same whichever municipio is selected
+    municipio = None if view == 'departamento' else municipio
+    return (data.version, aggregation_level, departamento, municipio, start_date, end_date, variable, view)
+
+
+def cached_figure(data, *selection):
+    """The figure of ``selection`` (update_graph's inputs) for ``data`` and its JSON size, from figure_cache or built into it."""
+    return figure_cache.get_or_build(figure_key(data, *selection), lambda: render_figure(data.cube, *selection, data.climatology))
+
+
+# The selection serve_layout opens with; None stands for the latest date
+DEFAULT_SELECTION = ('M', 'ANTIOQUIA', 'MEDELLÍN', '2017-01-01', None, 'temp_max', 'municipio')
+
+
+def record_selection(data, aggregation_level, departamento, municipio, start_date, end_date, variable, view):
+    # Counted as the warm-up replays it: the latest date as None, so the
+    # selection still means "up to today" after a refresh moves it.
+    if end_date == data.store.date_max.date().isoformat():
+        end_date = None
+    if view == 'departamento':
+        municipio = None
+    selection_log.record((aggregation_level, departamento, municipio, start_date, end_date, variable, view))
+
+
+def prefetch(kind, data, selection):
+    """Build the figure of ``selection`` in the background unless it is cached or ``data`` was replaced."""
+    def task():
+        if live.current is not data:
+            return "stale"
+        if figure_key(data, *selection) in figure_cache:
+            return "cached"
+        cached_figure(data, *selection)
+        return "built"
+    return prefetcher.submit(kind, task)
+
+
+def warm_up(dataset):
+    """Queue the default and the most requested selections of a newly published dataset."""
+    selection_log.save()
+    if dataset.store.date_max is None:
+        return
+    latest = dataset.store.date_max.date().isoformat()
+    for selection in dict.fromkeys([DEFAULT_SELECTION, *selection_log.top(warmup_selections)]):
+        aggregation_level, departamento, municipio, start_date, end_date, variable, view = selection
+        prefetch("warmup", dataset, (aggregation_level, departamento, municipio, start_date, end_date or latest, variable, view))
+
+
+# Subscribed once the figures can be built; the dataset published while
+# loading above is warmed here.
+live.subscribe(warm_up)
+if live.current is not None:
+    warm_up(live.current)
+
+
+# Zooming into a chart narrows the dates, so the zoomed span is sent again,
+# at full resolution once it fits the point budget
+@app.callback(
+    [Output('date-picker-range', 'start_date'),
+     Output('date-picker-range', 'end_date')],
+    [Input('temperature-evolution-graph', 'relayoutData')],
+    [State('view-dropdown', 'value')],
+    prevent_initial_call=True
 )
-def update_graph(aggregation_level,selected_departamento, selected_municipio, start_date, end_date, selected_variable):
-    filtered_df = df[(df['departamento'] == selected_departamento) & (df['municipio'] == selected_municipio)]
+def zoom_dates(relayout, selected_view):
+    if selected_view == 'departamento' or not relayout or 'xaxis.range[0]' not in relayout:
+        return dash.no_update, dash.no_update
+    store = live.current.store
+    start = max(pd.Timestamp(relayout['xaxis.range[0]']).normalize(), store.date_min)
+    end = min(pd.Timestamp(relayout['xaxis.range[1]']).normalize(), store.date_max)
+    if start > end:
+        return dash.no_update, dash.no_update
+    return start.strftime("%Y-%m-%d"), end.strftime("%Y-%m-%d")
+
 
-    if aggregation_level == 'W':
-        fig = weekly_evolution_of_temperature_per_municipio(filtered_df, selected_departamento, selected_municipio, start_date, end_date, selected_variable)
+def patch_figure(cube, aggregation_level, departamento, municipio, min_date, max_date, variable):
+    """The changes to the compact figure of the same municipio and aggregation for new dates or variable.
+
+    None when the new series is empty, which needs the whole "no data" figure.
+    """
+    df_temp, note = budgeted_series(cube, aggregation_level, departamento, municipio, variable, min_date, max_date)
+    if df_temp.empty:
+        return None
+
+    values = typed_array(df_temp[variable].to_numpy())
+    max_dates = df_temp["date"].max().strftime("%Y-%m-%d")
+    unit = UNITS[variable]
+    patch = Patch()
+    patch["data"][0]["x"] = typed_array(epoch_ms(df_temp["date"]))
+    patch["data"][0]["y"] = values
+    patch["data"][0]["marker"]["color"] = values
+    patch["data"][0]["marker"]["size"] = values
+    # What px derives from the sizes, with the size_max=20 of the charts
+    patch["data"][0]["marker"]["sizeref"] = float(df_temp[variable].max()) / 20 ** 2
+    # The variable may have changed unit (°C, mm): the labels px gave the
+    # charts, with compact_json's hover template, which has no frame.
+    patch["data"][0]["hovertemplate"] = f'Fecha=%{{x}}<br>{unit}=%{{marker.color}}<extra></extra>'
+    patch["layout"]["coloraxis"]["colorbar"]["title"]["text"] = unit
+    patch["layout"]["yaxis"]["title"]["text"] = unit
+    patch["layout"]["title"]["text"] = evolution_title(aggregation_level, variable, departamento, municipio, min_date, max_dates, note)
+    if aggregation_level not in ('D', 'A'):
+        patch["layout"]["xaxis"]["tick0"] = df_temp["date"].min().isoformat()
+    patch["animation"]["count"] = len(df_temp)
+    lap("patch", payload_bytes=len(json.dumps(patch.to_plotly_json())))
+    return patch
+
+
+def render_figure(*args):
+    fig = build_figure(*args)
+    payload = compact_json(fig) if compact_figures else fig.to_json()
+    lap("serialize")
+    return payload
+
+
+def build_figure(cube, aggregation_level,selected_departamento, selected_municipio, start_date, end_date, selected_variable, selected_view='municipio', climatology=None):
+    if selected_view == 'departamento':
+        fig = departamento_heatmap(cube, aggregation_level, selected_departamento, start_date, end_date, selected_variable)
+    elif selected_view == 'anomalia':
+        fig = anomaly_figure(cube, climatology, aggregation_level, selected_departamento, selected_municipio, start_date, end_date, selected_variable)
+    elif aggregation_level == 'D':
+        fig = daily_evolution_of_temperature_per_municipio(cube, selected_departamento, selected_municipio, start_date, end_date, selected_variable)
+    elif aggregation_level == 'W':
+        fig = weekly_evolution_of_temperature_per_municipio(cube, selected_departamento, selected_municipio, start_date, end_date, selected_variable)
     elif aggregation_level == 'M':
-        fig = monthly_evolution_of_temperature_per_municipio(filtered_df, selected_departamento, selected_municipio, start_date, end_date, selected_variable)
+        fig = monthly_evolution_of_temperature_per_municipio(cube, selected_departamento, selected_municipio, start_date, end_date, selected_variable)
     elif aggregation_level == 'Q':
-        fig = quarterly_evolution_of_temperature_per_municipio(filtered_df, selected_departamento, selected_municipio, start_date, end_date, selected_variable)
+        fig = quarterly_evolution_of_temperature_per_municipio(cube, selected_departamento, selected_municipio, start_date, end_date, selected_variable)
     elif aggregation_level == 'A':
-        fig = yearly_evolution_of_temperature_per_municipio(filtered_df, selected_departamento, selected_municipio, start_date, end_date, selected_variable)
+        fig = yearly_evolution_of_temperature_per_municipio(cube, selected_departamento, selected_municipio, start_date, end_date, selected_variable)
     else:
         # You can customize this part to show a more specific message or an empty plot
-        fig.update_layout(title_text='Nivel de agrupación no reconocido o no seleccionado')
+        fig = px.scatter(title='Nivel de agrupación no reconocido o no seleccionado')
 
+    lap("figure")
     return fig
 
 if __name__ == '__main__':
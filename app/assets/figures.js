@@ -0,0 +1,71 @@
+// Expands the compact figures update_graph sends (see frames.compact_json).
+//
+// A compact figure carries the series once, every point array as a binary
+// typed array ({dtype, bdata}), and `animation.count` in place of its frames.
+// Frame i shows points 0..i: the arrays are decoded once and each frame holds
+// subarray views of them, so nothing is copied per frame. Figures without
+// `animation` pass through untouched.
+(function () {
+    const ARRAYS = {
+        f8: Float64Array, f4: Float32Array,
+        i4: Int32Array, u4: Uint32Array, i2: Int16Array, u2: Uint16Array, i1: Int8Array, u1: Uint8Array,
+    };
+
+    function isObject(value) {
+        return value !== null && typeof value === 'object' && !Array.isArray(value) && !ArrayBuffer.isView(value);
+    }
+
+    function decode(value) {
+        if (!isObject(value)) {
+            return value;
+        }
+        if (typeof value.bdata === 'string' && ARRAYS[value.dtype]) {
+            const bytes = Uint8Array.from(atob(value.bdata), c => c.charCodeAt(0));
+            return new ARRAYS[value.dtype](bytes.buffer);
+        }
+        const decoded = {};
+        for (const [name, item] of Object.entries(value)) {
+            decoded[name] = decode(item);
+        }
+        return decoded;
+    }
+
+    // The trace with every point array cut to its first n points.
+    function head(trace, n) {
+        const cut = {};
+        for (const [name, value] of Object.entries(trace)) {
+            if (ArrayBuffer.isView(value)) {
+                cut[name] = value.subarray(0, n);
+            } else if (isObject(value)) {
+                cut[name] = head(value, n);
+            } else {
+                cut[name] = value;
+            }
+        }
+        return cut;
+    }
+
+    function expand(figure) {
+        if (!figure || !figure.animation) {
+            return figure;
+        }
+        const trace = decode(figure.data[0]);
+        const slider = figure.layout.sliders[0];
+        const step = slider.steps[0];
+        const frames = [];
+        const steps = [];
+        for (let i = 0; i < figure.animation.count; i++) {
+            const name = String(i);
+            frames.push({name: name, data: [head(trace, i + 1)]});
+            steps.push(Object.assign({}, step, {args: [[name], step.args[1]], label: name}));
+        }
+        return {
+            data: [head(trace, 1)],
+            layout: Object.assign({}, figure.layout, {sliders: [Object.assign({}, slider, {steps: steps})]}),
+            frames: frames,
+        };
+    }
+
+    window.dash_clientside = Object.assign({}, window.dash_clientside);
+    window.dash_clientside.figures = {expand: expand};
+})();
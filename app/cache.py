@@ -0,0 +1,188 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+
+
+class FigureCache:
+    """LRU cache of serialized figures keyed by the full callback selection.
+
+    The in-memory tier is bounded both by entry count and by the size of the
+    serialized figures. With a ``directory`` every entry is also written to
+    disk, so worker processes sharing that directory reuse each other's work.
+    The disk tier has the same two limits, for all the workers together: past
+    them, the files read or written longest ago are deleted. Keys always start
+    with the data version; ``invalidate`` drops everything built from an
+    older version.
+    """
+
+    def __init__(self, max_entries=256, max_bytes=64 * 2**20, directory=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self.version = None
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.disk_evictions = 0
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        """Whether ``key`` is held in memory or on disk, without counting a hit."""
+        with self._lock:
+            if key in self._entries:
+                return True
+        return bool(self.directory) and os.path.exists(self._path(key))
+
+    def get_or_build(self, key, build):
+        """Return the cached figure dict for ``key`` and the size of its JSON, calling ``build()`` on a miss.
+
+        ``build`` returns the figure as a JSON string.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+
+        payload = self._read_disk(key)
+        if payload is not None:
+            with self._lock:
+                self.disk_hits += 1
+        else:
+            with self._lock:
+                self.misses += 1
+            payload = build()
+            self._write_disk(key, payload)
+
+        figure = json.loads(payload)
+        self._put(key, figure, len(payload))
+        return figure, len(payload)
+
+    def _put(self, key, figure, size):
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key[0] != self.version:
+                return
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous[1]
+            self._entries[key] = (figure, size)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._bytes -= evicted
+                self.evictions += 1
+
+    def clear(self):
+        """Forget every entry held in memory."""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def invalidate(self, version):
+        """Forget every entry that was not built from data ``version``."""
+        with self._lock:
+            if version == self.version:
+                return
+            self.version = version
+            self._entries.clear()
+            self._bytes = 0
+        if self.directory:
+            current = os.path.join(self.directory, str(version))
+            os.makedirs(current, exist_ok=True)
+            # Only prune versions older than ours; another worker may already
+            # be serving a newer one from the same directory.
+            cutoff = os.path.getmtime(current)
+            for name in os.listdir(self.directory):
+                path = os.path.join(self.directory, name)
+                if name != str(version) and os.path.getmtime(path) < cutoff:
+                    shutil.rmtree(path, ignore_errors=True)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "version": self.version,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "disk_evictions": self.disk_evictions,
+            }
+
+    def _path(self, key):
+        digest = hashlib.sha256(repr(key[1:]).encode()).hexdigest()
+        return os.path.join(self.directory, str(key[0]), f"{digest}.json")
+
+    def _read_disk(self, key):
+        if not self.directory:
+            return None
+        path = self._path(key)
+        try:
+            with open(path, encoding="utf-8") as f:
+                payload = f.read()
+            # The modification time orders the disk tier by last use.
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return payload
+
+    def _write_disk(self, key, payload):
+        if not self.directory or key[0] != self.version:
+            return
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write to a temporary file and rename so readers never see half a figure.
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(payload)
+        os.replace(tmp, path)
+        self._prune_disk(os.path.dirname(path))
+
+    def _prune_disk(self, directory):
+        files = []
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if not entry.name.endswith(".json"):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+        count, total = len(files), sum(size for _, size, _ in files)
+        # Oldest modification time first: the least recently used figure.
+        for _, size, path in sorted(files):
+            if count <= self.max_entries and total <= self.max_bytes:
+                break
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                # Another worker pruned it first.
+                pass
+            else:
+                with self._lock:
+                    self.disk_evictions += 1
+            count -= 1
+            total -= size
+
+
+def cache_from_env() -> FigureCache:
+    return FigureCache(
+        max_entries=int(os.getenv("FIGURE_CACHE_ENTRIES", "256")),
+        max_bytes=int(float(os.getenv("FIGURE_CACHE_MB", "64")) * 2**20),
+        directory=os.getenv("FIGURE_CACHE_DIR") or None,
+    )
@@ -0,0 +1,136 @@
+import numpy as np
+import pandas as pd
+
+from cube import valid_means
+
+
+STATS = ("mean", "std", "p10", "p25", "p50", "p75", "p90")
+PERCENTILES = {"p10": 0.10, "p25": 0.25, "p50": 0.50, "p75": 0.75, "p90": 0.90}
+
+# Calendar groups seen in fewer years than this get no baseline.
+MIN_YEARS = 3
+
+
+def _month(months):
+    return months % 12
+
+
+def _quarter(months):
+    return months % 12 // 3
+
+
+def _whole_year(months):
+    return np.zeros(len(months), dtype=np.int64)
+
+
+# The calendar group of a period label at each granularity, from the label's
+# month number since 1970, and how many groups there are: a period is compared
+# with the periods of the same granularity and group in other years. Days and
+# weeks are grouped by the calendar month of their label.
+SEASONS = {
+    "D": (_month, 12),
+    "W": (_month, 12),
+    "M": (_month, 12),
+    "Q": (_quarter, 4),
+    "A": (_whole_year, 1),
+}
+
+
+def _group_stats(group, year, values, groups):
+    """Distinct years and STATS of ``values`` for every group id in range(groups), NaN under MIN_YEARS years."""
+    present = ~np.isnan(values)
+    group, year, values = group[present], year[present], values[present]
+    count = np.bincount(group, minlength=groups)
+    total = np.bincount(group, weights=values, minlength=groups)
+    squares = np.bincount(group, weights=values ** 2, minlength=groups)
+    seen = np.zeros((groups, int(year.max()) + 1 if len(year) else 1), dtype=bool)
+    seen[group, year] = True
+    years = seen.sum(axis=1)
+    enough = years >= MIN_YEARS
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = total / count
+        # Sample variance; clipped because the difference can dip below 0 by rounding.
+        std = np.sqrt(np.maximum(squares - count * mean ** 2, 0) / (count - 1))
+    stats = {"mean": mean, "std": std}
+
+    # Each group's values sorted into one run, then interpolated like np.percentile.
+    # One argsort of a float key, every group a band wider than the values'
+    # range, orders them like np.lexsort((values, group)) in a fraction of the time.
+    smallest = values.min() if len(values) else 0.0
+    band = np.floor(values.max() - smallest) + 2 if len(values) else 1.0
+    order = np.argsort(group * band + (values - smallest))
+    ranked = values[order]
+    starts = np.concatenate(([0], np.cumsum(count)[:-1]))
+    for name, q in PERCENTILES.items():
+        position = starts + q * np.maximum(count - 1, 0)
+        low = np.floor(position).astype(np.int64)
+        high = np.ceil(position).astype(np.int64)
+        stats[name] = np.full(groups, np.nan)
+        stats[name][enough] = (ranked[low[enough]] + (ranked[high[enough]] - ranked[low[enough]])
+                               * (position[enough] - low[enough]))
+    for name in ("mean", "std"):
+        stats[name][~enough] = np.nan
+    return years, stats
+
+
+class Climatology:
+    """The normal of every municipio x calendar group, per granularity, from all years.
+
+    Each granularity is summarized from its own period means, so a day is
+    compared with the days of its calendar month in other years, a week with
+    the weeks, a month with the same month, a quarter with the same quarter
+    and a year with the other years (see SEASONS). For each variable it holds
+    the number of years, mean, standard deviation and percentiles, as
+    (municipio key x calendar group) arrays built in one vectorized pass over
+    each of the cube's tables; daily means are averaged from the store like
+    the cube does. Every dataset builds its own, so it follows each load and
+    refresh, and reading the baseline of a series is a lookup.
+    """
+
+    def __init__(self, cube):
+        self.key_index = cube.key_index
+        self.measures = list(cube.measures)
+        keys = len(cube.keys)
+        self.years = {}
+        self.stats = {}
+        for granularity, (season, groups) in SEASONS.items():
+            if granularity != "D" and granularity not in cube.tables:
+                continue
+            key, date, means = self._periods(cube, granularity)
+            # A period without a date has no calendar group; its NaT would read
+            # as the smallest int64 and stretch the range of years past memory.
+            dated = ~np.isnat(date)
+            if not dated.all():
+                key, date, means = key[dated], date[dated], {name: values[dated] for name, values in means.items()}
+            months = date.astype("datetime64[M]").astype(np.int64)
+            group = key.astype(np.int64) * groups + season(months)
+            year = months // 12
+            year -= year.min() if len(year) else 0
+            self.years[granularity], self.stats[granularity] = {}, {}
+            for name in self.measures:
+                years, stats = _group_stats(group, year, means[name], keys * groups)
+                self.years[granularity][name] = years.reshape(keys, groups)
+                self.stats[granularity][name] = {stat: values.reshape(keys, groups) for stat, values in stats.items()}
+
+    def _periods(self, cube, granularity):
+        """Key, period label and the mean of each measure for every period of ``granularity``."""
+        if granularity == "D":
+            # The cube keeps no daily table; average the store's rows per day as it does.
+            daily = cube._daily_means(cube.store)
+            ones = np.ones(len(daily["key"]))
+            return daily["key"], daily["date"], {name: valid_means(name, daily[name], ones) for name in self.measures}
+        table = cube.tables[granularity]["frame"]
+        return (table["key"].to_numpy(), table["date"].to_numpy(),
+                {name: table[name].to_numpy(dtype=np.float64) for name in self.measures})
+
+    def baseline(self, granularity, departamento, municipio, variable, dates) -> pd.DataFrame:
+        """STATS of the calendar group of each period label in ``dates``, among periods of ``granularity``."""
+        dates = np.asarray(dates, dtype="datetime64[ns]")
+        i = self.key_index.get((departamento, municipio))
+        if i is None or granularity not in self.stats:
+            return pd.DataFrame({stat: np.full(len(dates), np.nan) for stat in STATS})
+        season, _ = SEASONS[granularity]
+        group = season(dates.astype("datetime64[M]").astype(np.int64))
+        undated = np.isnat(dates)
+        stats = self.stats[granularity][variable]
+        return pd.DataFrame({stat: np.where(undated, np.nan, stats[stat][i][group]) for stat in STATS})
@@ -0,0 +1,280 @@
+import numpy as np
+import pandas as pd
+
+
+# Aggregated means outside these bounds are treated as bad readings and never plotted.
+VALID_RANGES = {
+    "temp_min": (0, 45),
+    "temp_avg": (0, 45),
+    "temp_max": (0, 45),
+    "precipitacion_total": (0, np.inf),
+}
+
+DAY = np.timedelta64(1, "D")
+
+
+def _month_end(days):
+    return (days.astype("datetime64[M]") + 1).astype("datetime64[D]") - DAY
+
+
+def _quarter_end(days):
+    months = days.astype("datetime64[M]").astype(np.int64)
+    return ((months // 3) * 3 + 3).astype("datetime64[M]").astype("datetime64[D]") - DAY
+
+
+def _year_end(days):
+    return (days.astype("datetime64[Y]") + 1).astype("datetime64[D]") - DAY
+
+
+def _day(days):
+    return days
+
+
+def _week_end_monday(days):
+    # 1970-01-01 was a Thursday; label each day with the Monday closing its week.
+    ordinal = days.astype(np.int64)
+    return (ordinal + (-(ordinal + 3)) % 7).astype("datetime64[D]")
+
+
+# Same labels as DataFrame.resample('D' / 'W-Mon' / 'M' / 'Q' / 'A').
+PERIOD_ENDS = {
+    "D": _day,
+    "W": _week_end_monday,
+    "M": _month_end,
+    "Q": _quarter_end,
+    "A": _year_end,
+}
+
+# Granularities with a rollup table; daily means are read from the store itself.
+ROLLUPS = ("W", "M", "Q", "A")
+
+
+def _group_starts(*columns):
+    changed = np.zeros(len(columns[0]) - 1, dtype=bool)
+    for column in columns:
+        changed |= column[1:] != column[:-1]
+    return np.concatenate(([0], np.flatnonzero(changed) + 1))
+
+
+def _sum_and_count(values, starts):
+    present = ~np.isnan(values)
+    sums = np.add.reduceat(np.where(present, values, 0.0), starts)
+    counts = np.add.reduceat(present.astype(np.int32), starts)
+    return sums, counts
+
+
+def valid_means(name, sums, counts):
+    """Period means rounded to one decimal, NaN where out of VALID_RANGES."""
+    with np.errstate(invalid="ignore", divide="ignore"):
+        means = np.round(sums / counts, 1)
+    low, high = VALID_RANGES.get(name, (-np.inf, np.inf))
+    means[~((means >= low) & (means <= high))] = np.nan
+    return means
+
+
+def period_grid(municipios, rows, dates, values):
+    """Scatter (row, date, value) triples into a municipio x period grid, NaN where missing."""
+    periods, columns = np.unique(dates, return_inverse=True)
+    grid = np.full((len(municipios), len(periods)), np.nan)
+    grid[rows, columns] = values
+    return list(municipios), periods, grid
+
+
+class RollupCube:
+    """Period means for every municipio x granularity x variable, built once.
+
+    Each table keeps the running sum and count behind every mean so new days
+    can be merged in without revisiting the history. Rows are sorted by
+    (municipio key, date) and addressed through per-key offsets like the store.
+    Daily means have no table: a day holds one row per station, so they are
+    averaged from the store's rows when asked for.
+    """
+
+    def __init__(self, store, granularities=ROLLUPS):
+        self.store = store
+        self.measures = list(store.measures)
+        self._index_keys(list(store.offsets))
+        daily = self._daily_means(store)
+        self.tables = {g: self._table(self._rollup(daily, g)) for g in granularities}
+
+    def _index_keys(self, keys):
+        self.keys = keys
+        self.key_index = {key: i for i, key in enumerate(keys)}
+        # Keys sort by departamento first, so each one owns a contiguous range.
+        self.departamento_keys = {}
+        for i, (departamento, _) in enumerate(keys):
+            start, _ = self.departamento_keys.get(departamento, (i, i))
+            self.departamento_keys[departamento] = (start, i + 1)
+
+    def _daily_means(self, store):
+        lengths = [stop - start for start, stop in store.offsets.values()]
+        key = np.repeat(np.arange(len(lengths), dtype=np.int32), lengths)
+        date = store.frame["date"].to_numpy().astype("datetime64[D]")
+        values = {name: store.frame[name].to_numpy(dtype=np.float64) for name in self.measures}
+        return self._daily(key, date, values)
+
+    def _daily(self, key, date, values):
+        # Several stations can report for one municipio on the same day;
+        # average them first, as select_municipio used to.
+        if not len(key):
+            return {"key": key, "date": date, **{m: np.empty(0) for m in self.measures}}
+
+        starts = _group_starts(key, date)
+        daily = {"key": key[starts], "date": date[starts]}
+        for name in self.measures:
+            sums, counts = _sum_and_count(values[name], starts)
+            with np.errstate(invalid="ignore", divide="ignore"):
+                daily[name] = sums / counts
+        return daily
+
+    def _rollup(self, daily, granularity):
+        key = daily["key"]
+        period = PERIOD_ENDS[granularity](daily["date"])
+        starts = _group_starts(key, period) if len(key) else np.empty(0, dtype=np.int64)
+
+        columns = {"key": key[starts], "date": period[starts].astype("datetime64[ns]")}
+        for name in self.measures:
+            if len(key):
+                sums, counts = _sum_and_count(daily[name], starts)
+            else:
+                sums, counts = np.empty(0), np.empty(0, dtype=np.int32)
+            columns[f"{name}_sum"] = sums
+            columns[f"{name}_count"] = counts
+        return columns
+
+    def _table(self, columns):
+        for name in self.measures:
+            columns[name] = valid_means(name, columns[f"{name}_sum"], columns[f"{name}_count"])
+        return self._bounded(pd.DataFrame(columns, copy=False))
+
+    def _bounded(self, frame):
+        bounds = np.searchsorted(frame["key"].to_numpy(), np.arange(len(self.keys) + 1))
+        return {"frame": frame, "starts": bounds[:-1], "stops": bounds[1:]}
+
+    @classmethod
+    def from_frames(cls, store, frames) -> "RollupCube":
+        """The cube whose tables write_snapshot saved, as ``{granularity: frame}``.
+
+        Nothing is rolled up again and the frames are used as they are, so
+        frames read from a memory-mapped snapshot stay shared with it.
+        """
+        cube = cls.__new__(cls)
+        cube.store = store
+        cube.measures = list(store.measures)
+        cube._index_keys(list(store.offsets))
+        cube.tables = {g: cube._bounded(frame) for g, frame in frames.items()}
+        return cube
+
+    def append(self, store, frame) -> "RollupCube":
+        """A new cube for ``store`` after ``frame`` was appended to it.
+
+        Only the new rows are rolled up; their periods are then merged into
+        the existing ones through the stored sums and counts, so a refresh
+        that adds a few days touches the history once per period, not per row.
+        """
+        cube = RollupCube.__new__(RollupCube)
+        cube.store = store
+        cube.measures = self.measures
+        cube._index_keys(list(store.offsets))
+
+        # New municipios shift the key positions of the ones sorted after them.
+        remap = np.array([cube.key_index[key] for key in self.keys], dtype=np.int32)
+        key = store.key_positions(frame["departamento"], frame["municipio"]).astype(np.int32)
+        date = frame["date"].to_numpy(dtype="datetime64[ns]").astype("datetime64[D]")
+        order = np.lexsort((date, key))
+        # Same float32 rounding the store applies, so the means match a full rebuild.
+        values = {name: frame[name].to_numpy(dtype=np.float32).astype(np.float64)[order] for name in self.measures}
+        daily = cube._daily(key[order], date[order], values)
+
+        cube.tables = {}
+        for granularity, table in self.tables.items():
+            old = table["frame"]
+            added = cube._rollup(daily, granularity)
+            columns = {
+                "key": np.concatenate((remap[old["key"].to_numpy()], added["key"])),
+                "date": np.concatenate((old["date"].to_numpy(), added["date"])),
+            }
+            for name in self.measures:
+                for part in (f"{name}_sum", f"{name}_count"):
+                    columns[part] = np.concatenate((old[part].to_numpy(), added[part]))
+            cube.tables[granularity] = cube._table(cube._merge(columns))
+        return cube
+
+    def _merge(self, columns):
+        # Periods that were open when the table was built get a second row
+        # from the new days; fold each (key, period) back into one row.
+        order = np.lexsort((columns["date"], columns["key"]))
+        columns = {name: values[order] for name, values in columns.items()}
+        if not len(order):
+            return columns
+        starts = _group_starts(columns["key"], columns["date"])
+        merged = {"key": columns["key"][starts], "date": columns["date"][starts]}
+        for name in self.measures:
+            merged[f"{name}_sum"] = np.add.reduceat(columns[f"{name}_sum"], starts)
+            merged[f"{name}_count"] = np.add.reduceat(columns[f"{name}_count"], starts)
+        return merged
+
+    def _days(self, first, last, variable, min_date, max_date):
+        """Valid daily means of keys first..last-1 between min_date and max_date, from the store."""
+        offsets = [self.store.offsets[key] for key in self.keys[first:last]]
+        start = offsets[0][0] if offsets else 0
+        key = np.repeat(np.arange(first, last, dtype=np.int32), [stop - begin for begin, stop in offsets])
+        rows = slice(start, start + len(key))
+        date = self.store.frame["date"].to_numpy()[rows].astype("datetime64[D]")
+        values = self.store.frame[variable].to_numpy(dtype=np.float64)[rows]
+        keep = ((date >= np.datetime64(pd.to_datetime(min_date), "D"))
+                & (date <= np.datetime64(pd.to_datetime(max_date), "D")))
+        key, date, values = key[keep], date[keep], values[keep]
+        if not len(key):
+            return key, date.astype("datetime64[ns]"), values
+
+        starts = _group_starts(key, date)
+        means = valid_means(variable, *_sum_and_count(values, starts))
+        present = ~np.isnan(means)
+        return key[starts][present], date[starts][present].astype("datetime64[ns]"), means[present]
+
+    def series(self, granularity, departamento, municipio, variable, min_date, max_date) -> pd.DataFrame:
+        """Valid period means of one variable between min_date and max_date."""
+        i = self.key_index.get((departamento, municipio))
+        if i is None:
+            return pd.DataFrame({"date": pd.Series(dtype="datetime64[ns]"), variable: pd.Series(dtype=float)})
+        if granularity == "D":
+            _, dates, means = self._days(i, i + 1, variable, min_date, max_date)
+            return pd.DataFrame({"date": dates, variable: means})
+
+        table = self.tables[granularity]
+
+        start, stop = table["starts"][i], table["stops"][i]
+        block = table["frame"].iloc[start:stop]
+        dates = block["date"].to_numpy()
+        lo = np.searchsorted(dates, np.datetime64(pd.to_datetime(min_date), "ns"), side="left")
+        hi = np.searchsorted(dates, np.datetime64(pd.to_datetime(max_date), "ns"), side="right")
+        block = block.iloc[lo:hi]
+        block = block.loc[block[variable].notna(), ["date", variable]]
+        return block.reset_index(drop=True)
+
+    def departamento_grid(self, granularity, departamento, variable, min_date, max_date):
+        """Valid period means of every municipio of a departamento between min_date and max_date.
+
+        The departamento's municipios are consecutive keys, so their periods are
+        one slice of the table, filtered and laid out as a grid in one pass.
+        Returns the municipio names, the period dates and a municipio x period
+        array of means, NaN where a municipio has no valid mean.
+        """
+        first, last = self.departamento_keys.get(departamento, (0, 0))
+        municipios = [municipio for _, municipio in self.keys[first:last]]
+        if granularity == "D":
+            keys, dates, means = self._days(first, last, variable, min_date, max_date)
+            return period_grid(municipios, keys - first, dates, means)
+
+        table = self.tables[granularity]
+        start, stop = (table["starts"][first], table["stops"][last - 1]) if last > first else (0, 0)
+
+        block = table["frame"].iloc[start:stop]
+        dates = block["date"].to_numpy()
+        values = block[variable].to_numpy()
+        keep = ((dates >= np.datetime64(pd.to_datetime(min_date), "ns"))
+                & (dates <= np.datetime64(pd.to_datetime(max_date), "ns"))
+                & ~np.isnan(values))
+        rows = block["key"].to_numpy()[keep] - first
+        return period_grid(municipios, rows, dates[keep], values[keep])
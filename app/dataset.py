@@ -0,0 +1,351 @@
+import datetime
+import fcntl
+import logging
+import os
+import threading
+import time
+
+from store import TemperatureStore, complete_rows
+from cube import RollupCube
+from climatology import Climatology
+from metrics import REGISTRY
+from snapshot import current_version, read_snapshot, write_snapshot
+from warehouse import WarehouseDataset
+
+
+log = logging.getLogger(__name__)
+
+REFRESH_SECONDS = REGISTRY.gauge(
+    "weather_refresh_duration_seconds", "Wall time of the last refresh.", ["kind"])
+REFRESH_ROWS = REGISTRY.gauge(
+    "weather_refresh_rows", "Rows fetched by the last refresh.", ["kind"])
+REFRESH_ROWS_TOTAL = REGISTRY.counter(
+    "weather_refresh_rows_total", "Rows fetched by all refreshes.", ["kind"])
+REFRESH_RUNS = REGISTRY.counter(
+    "weather_refresh_runs_total", "Refreshes run, by outcome.", ["kind", "result"])
+REFRESH_LAST_SUCCESS = REGISTRY.gauge(
+    "weather_refresh_last_success_timestamp_seconds", "Unix time the last successful refresh finished.", ["kind"])
+DATASET_ROWS = REGISTRY.gauge(
+    "weather_dataset_rows", "Rows in the dataset being served.")
+DATASET_DATE_MAX = REGISTRY.gauge(
+    "weather_dataset_date_max_timestamp_seconds", "Latest observation date in the dataset being served.")
+
+
+def _now():
+    return datetime.datetime.now(datetime.timezone.utc)
+
+
+class Dataset:
+    """One published generation of the data: the store and everything derived from it.
+
+    A dataset is never modified after it is built. Callbacks read
+    ``live.current`` once and work on that generation until they return.
+    """
+
+    def __init__(self, store, origin, snapshot=None, cube=None, mapped=False, modified=None):
+        self.store = store
+        self.cube = cube if cube is not None else RollupCube(store)
+        self.climatology = Climatology(self.cube)
+        self.version = store.version
+        self.origin = origin
+        self.snapshot = snapshot
+        # True when the columns are views on a memory-mapped snapshot
+        self.mapped = mapped
+        self.loaded_at = _now()
+        # When this version of the data was saved, the same in every process
+        # serving it: the snapshot's stamp. Without one, when it was loaded;
+        # a backfill changes the version but not the newest observation.
+        self.modified = modified or self.loaded_at.replace(microsecond=0)
+
+    def append(self, frame, origin=None) -> "Dataset":
+        """The next generation, with ``frame``'s newer rows added incrementally."""
+        # The cube rolls up the same rows the store keeps.
+        frame = complete_rows(frame)
+        store = self.store.append(frame)
+        return Dataset(store, origin or self.origin, cube=self.cube.append(store, frame))
+
+    def describe(self):
+        return {
+            "version": self.version,
+            "origin": self.origin,
+            "mode": "memory",
+            "snapshot": self.snapshot,
+            "mapped": self.mapped,
+            "rows": len(self.store),
+            "date_min": self.store.date_min.isoformat() if self.store.date_min is not None else None,
+            "date_max": self.store.date_max.isoformat() if self.store.date_max is not None else None,
+            "loaded_at": self.loaded_at.isoformat(timespec="seconds"),
+            "modified": self.modified.isoformat() if self.modified is not None else None,
+        }
+
+
+class LiveDataset:
+    """Holds the dataset being served and swaps in newer ones atomically."""
+
+    def __init__(self):
+        self.current = None
+        self.last_error = None
+        # Held by whichever load or refresh is running, so they never overlap.
+        self.refresh_lock = threading.Lock()
+        self._listeners = []
+        self._lock = threading.Lock()
+
+    @property
+    def ready(self):
+        return self.current is not None
+
+    @property
+    def refreshing(self):
+        return self.refresh_lock.locked()
+
+    def subscribe(self, listener):
+        """Call ``listener(dataset)`` every time a new dataset is published."""
+        self._listeners.append(listener)
+
+    def publish(self, dataset):
+        with self._lock:
+            # Rebinding one attribute is atomic: readers see the old or the new
+            # dataset, never a mix of the two.
+            self.current = dataset
+            DATASET_ROWS.set(len(dataset.store))
+            if dataset.store.date_max is not None:
+                DATASET_DATE_MAX.set(dataset.store.date_max.timestamp())
+            for listener in self._listeners:
+                listener(dataset)
+
+    def status(self):
+        current = self.current
+        return {
+            "ready": current is not None,
+            "refreshing": self.refreshing,
+            "last_error": self.last_error,
+            "dataset": current.describe() if current is not None else None,
+        }
+
+
+def _save_snapshot(dataset, snapshot_dir, source):
+    if snapshot_dir:
+        # Whole seconds, as the snapshot records them, so processes mapping it agree.
+        dataset.modified = _now().replace(microsecond=0)
+        dataset.snapshot = os.path.basename(write_snapshot(
+            dataset.store, snapshot_dir, origin=repr(source), cube=dataset.cube, created=dataset.modified))
+
+
+def snapshot_dataset(snapshot) -> Dataset:
+    """A dataset over the mapped snapshot; its cube too, when the snapshot saved one."""
+    store = TemperatureStore.from_sorted_frame(snapshot.to_dataframe(), version=snapshot.version)
+    rollups = snapshot.rollup_frames()
+    cube = RollupCube.from_frames(store, rollups) if rollups else None
+    modified = datetime.datetime.fromisoformat(snapshot.created) if snapshot.created else None
+    return Dataset(store, origin=snapshot.origin, snapshot=snapshot.name, cube=cube, mapped=True, modified=modified)
+
+
+def load_from_source(source, snapshot_dir=None) -> Dataset:
+    dataset = Dataset(TemperatureStore(source.read()), origin=repr(source))
+    _save_snapshot(dataset, snapshot_dir, source)
+    return dataset
+
+
+def _run_refresh(live, kind, source, fetch):
+    """Run ``fetch()`` under the refresh lock and record how it went.
+
+    ``fetch`` returns the number of rows it read. A refresh that finds
+    another one running is skipped rather than queued.
+    """
+    if not live.refresh_lock.acquire(blocking=False):
+        log.info("Skipping %s refresh from %r; another refresh is running", kind, source)
+        return
+    started = time.perf_counter()
+    try:
+        rows = fetch()
+    except Exception as exc:
+        live.last_error = f"{type(exc).__name__}: {exc}"
+        REFRESH_RUNS.inc(kind=kind, result="error")
+        log.exception("%s refresh from %r failed; still serving %s",
+                      kind.capitalize(), source, live.current and live.current.version)
+    else:
+        live.last_error = None
+        REFRESH_RUNS.inc(kind=kind, result="ok")
+        REFRESH_ROWS.set(rows, kind=kind)
+        REFRESH_ROWS_TOTAL.inc(rows, kind=kind)
+        REFRESH_LAST_SUCCESS.set(time.time(), kind=kind)
+    finally:
+        REFRESH_SECONDS.set(time.perf_counter() - started, kind=kind)
+        live.refresh_lock.release()
+
+
+def warm_load(live, source, snapshot_dir):
+    """Reload from the source and publish it if it differs from what is live."""
+    def fetch():
+        dataset = load_from_source(source)
+        if live.current is None or dataset.version != live.current.version:
+            _save_snapshot(dataset, snapshot_dir, source)
+            live.publish(dataset)
+            log.info("Published %s from %r", dataset.version, source)
+        else:
+            log.info("Snapshot %s is up to date with %r", live.current.snapshot, source)
+        return len(dataset.store)
+
+    _run_refresh(live, "full", source, fetch)
+
+
+def incremental_refresh(live, source, snapshot_dir=None):
+    """Fetch the rows dated after the live dataset and publish them appended."""
+    def fetch():
+        current = live.current
+        frame = source.read_since(current.store.date_max)
+        if len(frame):
+            dataset = current.append(frame, origin=repr(source))
+            _save_snapshot(dataset, snapshot_dir, source)
+            live.publish(dataset)
+            log.info("Appended %s rows after %s from %r", len(frame), current.store.date_max.date(), source)
+        return len(frame)
+
+    _run_refresh(live, "incremental", source, fetch)
+
+
+def catalog_refresh(live, source, snapshot_dir=None):
+    """In pushdown mode, re-read the catalog and publish it if the warehouse changed."""
+    def fetch():
+        dataset = WarehouseDataset(source)
+        if live.current is None or dataset.version != live.current.version:
+            live.publish(dataset)
+            log.info("Warehouse data changed; now serving %s", dataset.version)
+        return len(dataset.store)
+
+    _run_refresh(live, "catalog", source, fetch)
+
+
+def follow_snapshot(live, source, snapshot_dir):
+    """Map the current snapshot when it is not the one this process serves.
+
+    That covers a snapshot another process wrote and one this process wrote
+    after a refresh, whose private copy is then dropped for the shared pages.
+    """
+    current = live.current
+    if current is not None and current.mapped and current_version(snapshot_dir) == current.version:
+        return
+
+    def fetch():
+        snapshot = read_snapshot(snapshot_dir)
+        if snapshot is None:
+            return 0
+        live.publish(snapshot_dataset(snapshot))
+        log.info("Mapped snapshot %s", snapshot.name)
+        return snapshot.table.num_rows
+
+    _run_refresh(live, "snapshot", source, fetch)
+
+
+class SnapshotLock:
+    """An advisory lock on a file in the snapshot directory, shared by every process using it.
+
+    The kernel drops it when its holder exits, so a worker that dies does not
+    leave it behind.
+    """
+
+    def __init__(self, snapshot_dir, name):
+        os.makedirs(snapshot_dir, exist_ok=True)
+        self._file = open(os.path.join(snapshot_dir, name), "a")
+
+    def acquire(self, blocking=True) -> bool:
+        try:
+            fcntl.flock(self._file, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+        except BlockingIOError:
+            return False
+        return True
+
+    def release(self):
+        fcntl.flock(self._file, fcntl.LOCK_UN)
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class Refresher:
+    """Runs ``refresh`` (incremental_refresh by default) every ``interval`` seconds on a daemon thread."""
+
+    def __init__(self, live, source, interval, snapshot_dir=None, refresh=incremental_refresh):
+        self.live = live
+        self.source = source
+        self.interval = interval
+        self.snapshot_dir = snapshot_dir
+        self.refresh = refresh
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="refresher", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            if self.live.current is not None:
+                self.refresh(self.live, self.source, self.snapshot_dir)
+
+
+def start(live, source, snapshot_dir=None, refresh=True):
+    """Publish the first dataset, from the local snapshot when there is one.
+
+    With a snapshot the app is ready as soon as it is mapped, and the source
+    is read again in a background thread. Without one the source is read
+    before returning, as the app always did.
+    """
+    snapshot = read_snapshot(snapshot_dir) if snapshot_dir else None
+    if snapshot is None:
+        live.publish(load_from_source(source, snapshot_dir))
+        return None
+
+    live.publish(snapshot_dataset(snapshot))
+    log.info("Serving snapshot %s (%s rows)", snapshot.name, snapshot.table.num_rows)
+    if not refresh:
+        return None
+    thread = threading.Thread(target=warm_load, args=(live, source, snapshot_dir), name="warm-load", daemon=True)
+    thread.start()
+    return thread
+
+
+def ensure_snapshot(source, snapshot_dir):
+    """Load the source into a snapshot unless there is a usable one already."""
+    # Only one process reads the source when several start without a snapshot.
+    with SnapshotLock(snapshot_dir, "LOADING"):
+        if read_snapshot(snapshot_dir) is None:
+            load_from_source(source, snapshot_dir)
+
+
+# Held for the life of the process that won it
+_leader = None
+
+
+def start_shared(live, source, snapshot_dir, refresh=True) -> bool:
+    """Publish the snapshot, mapped, in one of several processes serving it.
+
+    Every process maps the same files, so the table and the cube sit once in
+    the page cache however many workers there are. One of them, the leader,
+    also reads the source (at start when ``refresh``, then on schedule) and
+    writes the snapshots the others follow; returns whether this one leads.
+    """
+    global _leader
+    snapshot = read_snapshot(snapshot_dir)
+    if snapshot is None:
+        ensure_snapshot(source, snapshot_dir)
+        snapshot = read_snapshot(snapshot_dir)
+    live.publish(snapshot_dataset(snapshot))
+    log.info("Serving snapshot %s (%s rows), mapped", snapshot.name, snapshot.table.num_rows)
+
+    lock = SnapshotLock(snapshot_dir, "LEADER")
+    if not lock.acquire(blocking=False):
+        return False
+    _leader = lock
+    log.info("Process %s refreshes %s", os.getpid(), snapshot_dir)
+    if refresh:
+        threading.Thread(target=warm_load, args=(live, source, snapshot_dir), name="warm-load", daemon=True).start()
+    return True
@@ -0,0 +1,479 @@
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pacsv
+import pyarrow.parquet as pq
+
+
+TABLE = "brz_dev.dbdemos.colombian_temperature_data"
+BATCH_SIZE = 250_000
+POOL_SIZE = 4
+LOAD_WORKERS = 4
+
+log = logging.getLogger(__name__)
+
+# One slice of the table that can be fetched on its own connection.
+Partition = namedtuple("Partition", ["name", "predicate", "parameters"])
+
+
+def clean_names(departamento, municipio):
+    """The departamento and municipio Arrow columns as the loader cleans them."""
+    departamento = pc.utf8_trim_whitespace(departamento)
+    departamento = pc.replace_substring(departamento, "SAN ANDRES Y  PROVIDENCIA", "SAN ANDRES Y PROVIDENCIA")
+    return departamento, pc.utf8_trim_whitespace(municipio)
+
+
+def clean_table(table: pa.Table) -> pa.Table:
+    """Apply the loader's cleaning steps column-wise on an Arrow table."""
+    date = table.column("date")
+    if not pa.types.is_timestamp(date.type):
+        date = date.cast(pa.timestamp("ns"))
+    departamento, municipio = clean_names(table.column("departamento"), table.column("municipio"))
+
+    for name, column in (("date", date), ("departamento", departamento), ("municipio", municipio)):
+        table = table.set_column(table.schema.get_field_index(name), name, column)
+    return table
+
+
+def batches_to_table(batches) -> pa.Table:
+    """One table from record batches whose schemas may differ in null columns.
+
+    A batch where a column is all null can come back with the null type for
+    it; the schemas are promoted to a common one instead of failing.
+    """
+    return pa.concat_tables([pa.Table.from_batches([batch]) for batch in batches], promote_options="default")
+
+
+def table_to_dataframe(table: pa.Table) -> pd.DataFrame:
+    # self_destruct releases each Arrow column as soon as it is converted, so
+    # peak memory stays close to one copy of the table instead of two.
+    return table.to_pandas(split_blocks=True, self_destruct=True)
+
+
+class DataSource:
+    """A place the temperature table can be read from as Arrow record batches.
+
+    ``read`` fetches and cleans the table in ``partition_by`` slices on
+    ``load_workers`` threads when the source can be split that way.
+    """
+
+    partition_by = None
+    load_workers = 1
+
+    def batches(self):
+        raise NotImplementedError
+
+    def partitions(self, by):
+        """How the table splits for a parallel load; empty if it does not."""
+        return []
+
+    def partition_batches(self, partition):
+        raise NotImplementedError
+
+    def read_table(self) -> pa.Table:
+        batches = list(self.batches())
+        if not batches:
+            raise ValueError(f"{self!r} returned no data")
+        return batches_to_table(batches)
+
+    def batches_since(self, since):
+        """Batches holding only the rows dated after ``since``.
+
+        Sources that can filter on their side override this; the default
+        reads everything and filters each batch in Arrow.
+        """
+        bound = pa.scalar(pd.Timestamp(since).to_pydatetime())
+        for batch in self.batches():
+            date = batch.column("date")
+            if not pa.types.is_timestamp(date.type):
+                date = date.cast(pa.timestamp("ns"))
+            yield batch.filter(pc.greater(date, bound))
+
+    def read(self) -> pd.DataFrame:
+        partitions = self.partitions(self.partition_by) if self.partition_by else []
+        if len(partitions) < 2 or self.load_workers < 2:
+            return table_to_dataframe(clean_table(self.read_table()))
+        return table_to_dataframe(self.read_partitioned(partitions, self.load_workers))
+
+    def _load_partition(self, partition):
+        started = time.perf_counter()
+        batches = list(self.partition_batches(partition))
+        fetched = time.perf_counter()
+        table = clean_table(batches_to_table(batches)) if batches else None
+        cleaned = time.perf_counter()
+        rows = table.num_rows if table is not None else 0
+        log.info("Partition %s: %d rows, fetch %.2f s, clean %.2f s",
+                 partition.name, rows, fetched - started, cleaned - fetched)
+        return table
+
+    def read_partitioned(self, partitions, workers) -> pa.Table:
+        """Fetch and clean every partition on a bounded thread pool.
+
+        Each partition uses its own connection and is cleaned on the thread
+        that fetched it. The cleaned tables are stitched together without
+        copying; the only full copy made is the final conversion to pandas.
+        """
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="load") as executor:
+            tables = [t for t in executor.map(self._load_partition, partitions) if t is not None]
+        if not tables:
+            raise ValueError(f"{self!r} returned no data")
+        # A column that is all null in one partition comes back with the null type there.
+        table = pa.concat_tables(tables, promote_options="default")
+        log.info("Loaded %d rows from %r in %d partitions on %d threads in %.2f s",
+                 table.num_rows, self, len(partitions), workers, time.perf_counter() - started)
+        return table
+
+    def read_since(self, since) -> pd.DataFrame:
+        """The cleaned rows dated after ``since``; empty when there are none."""
+        batches = [batch for batch in self.batches_since(since) if batch.num_rows]
+        if not batches:
+            return pd.DataFrame()
+        return table_to_dataframe(clean_table(batches_to_table(batches)))
+
+
+class ConnectionPool:
+    """Keeps up to ``size`` connections open and lends them out one caller at a time.
+
+    A connection that raised while lent out is closed instead of returned,
+    so a broken session is never handed to the next caller.
+    """
+
+    def __init__(self, connect, size=POOL_SIZE):
+        self.size = size
+        self._connect = connect
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+
+    @contextmanager
+    def connection(self):
+        with self._slots:
+            try:
+                connection = self._idle.get_nowait()
+            except queue.Empty:
+                connection = self._connect()
+            try:
+                yield connection
+            except BaseException:
+                connection.close()
+                raise
+            self._idle.put(connection)
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+class SqlSource(DataSource):
+    """A SQL engine holding the table, which can also run aggregations itself.
+
+    Subclasses provide ``connect`` and ``run`` plus the few dialect pieces the
+    pushed-down queries need; the defaults follow Databricks SQL.
+    """
+
+    table = TABLE
+    batch_size = BATCH_SIZE
+    _pool = None
+    _pool_lock = threading.Lock()
+
+    def connect(self):
+        raise NotImplementedError
+
+    def run(self, connection, query, parameters=None):
+        """Yield the result of ``query`` on ``connection`` as record batches."""
+        raise NotImplementedError
+
+    def execute(self, query, parameters=None):
+        # Bulk reads get their own connection and release it when done.
+        connection = self.connect()
+        try:
+            yield from self.run(connection, query, parameters)
+        finally:
+            connection.close()
+
+    @property
+    def pool(self) -> ConnectionPool:
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = ConnectionPool(self.connect, int(os.getenv("WEATHER_POOL_SIZE", POOL_SIZE)))
+            return self._pool
+
+    def query(self, query, parameters=None) -> pd.DataFrame:
+        """Run a small query on a pooled connection and return it as a frame."""
+        with self.pool.connection() as connection:
+            batches = list(self.run(connection, query, parameters))
+        if not batches:
+            return pd.DataFrame()
+        return batches_to_table(batches).to_pandas()
+
+    def fetch(self, query, parameters=None) -> pd.DataFrame:
+        """Like ``query``, on a connection of its own that is closed afterwards.
+
+        For the few small queries of a bulk load, which has no use for the
+        pool and would otherwise leave a connection open in it.
+        """
+        batches = list(self.execute(query, parameters))
+        if not batches:
+            return pd.DataFrame()
+        return batches_to_table(batches).to_pandas()
+
+    def batches(self):
+        return self.execute(f"SELECT * FROM {self.table}")
+
+    def batches_since(self, since):
+        return self.execute(
+            f"SELECT * FROM {self.table} WHERE {self.timestamp('date')} > {self.param('since')}",
+            {"since": self.bind_timestamp(since)},
+        )
+
+    def partitions(self, by):
+        timestamp = self.timestamp("date")
+        if by == "year":
+            bounds = self.fetch(f"SELECT MIN({timestamp}) AS lo, MAX({timestamp}) AS hi FROM {self.table}")
+            lo, hi = pd.to_datetime(bounds["lo"]).iloc[0], pd.to_datetime(bounds["hi"]).iloc[0]
+            if pd.isna(lo):
+                return []
+            predicate = f"{timestamp} >= {self.param('lo')} AND {timestamp} < {self.param('hi')}"
+            partitions = [
+                Partition(str(year), predicate, {
+                    "lo": self.bind_timestamp(pd.Timestamp(year, 1, 1)),
+                    "hi": self.bind_timestamp(pd.Timestamp(year + 1, 1, 1)),
+                })
+                for year in range(lo.year, hi.year + 1)
+            ]
+            return partitions + [Partition("no date", "date IS NULL", {})]
+        if by == "departamento":
+            # Raw values, so each partition is an equality on the stored column.
+            names = self.fetch(f"SELECT DISTINCT departamento FROM {self.table} WHERE departamento IS NOT NULL")
+            partitions = [
+                Partition(name.strip(), f"departamento = {self.param('departamento')}", {"departamento": name})
+                for name in names.get("departamento", [])
+            ]
+            return partitions + [Partition("no departamento", "departamento IS NULL", {})]
+        raise ValueError(f"Cannot partition {self!r} by {by!r}; use 'year' or 'departamento'")
+
+    def partition_batches(self, partition):
+        return self.execute(f"SELECT * FROM {self.table} WHERE {partition.predicate}", partition.parameters)
+
+    # Dialect
+
+    def param(self, name):
+        return f":{name}"
+
+    def bind_timestamp(self, value):
+        return pd.Timestamp(value).to_pydatetime()
+
+    def bind_day(self, value):
+        return pd.Timestamp(value).date()
+
+    def timestamp(self, column):
+        return column
+
+    def day(self, column):
+        return f"CAST({column} AS DATE)"
+
+    def period_start(self, granularity, day):
+        """First day of the period holding ``day``, for the labels in cube.PERIOD_ENDS.
+
+        Weeks run Tuesday to Monday like resample('W-Mon'), so they are
+        truncated from the day before.
+        """
+        if granularity == "D":
+            return day
+        if granularity == "W":
+            return f"date_trunc('WEEK', {day} - INTERVAL 1 DAY)"
+        unit = {"M": "MONTH", "Q": "QUARTER", "A": "YEAR"}[granularity]
+        return f"date_trunc('{unit}', {day})"
+
+
+class DatabricksSource(SqlSource):
+    def __init__(self, server_hostname, http_path, access_token, table=TABLE, batch_size=BATCH_SIZE):
+        self.server_hostname = server_hostname
+        self.http_path = http_path
+        self.access_token = access_token
+        self.table = table
+        self.batch_size = batch_size
+
+    def __repr__(self):
+        return f"DatabricksSource({self.server_hostname!r}, table={self.table!r})"
+
+    def connect(self):
+        from databricks.sql import connect
+
+        return connect(
+            server_hostname=self.server_hostname,
+            http_path=self.http_path,
+            access_token=self.access_token,
+        )
+
+    def run(self, connection, query, parameters=None):
+        with connection.cursor(arraysize=self.batch_size) as cursor:
+            cursor.execute(query, parameters)
+            while True:
+                chunk = cursor.fetchmany_arrow(self.batch_size)
+                if chunk.num_rows == 0:
+                    break
+                yield from chunk.to_batches()
+
+
+class ParquetSource(DataSource):
+    def __init__(self, path, batch_size=BATCH_SIZE):
+        self.path = path
+        self.batch_size = batch_size
+
+    def __repr__(self):
+        return f"ParquetSource({self.path!r})"
+
+    def batches(self):
+        return pq.ParquetFile(self.path).iter_batches(batch_size=self.batch_size)
+
+    def partitions(self, by):
+        # The file is already split into row groups; load those in parallel
+        # whatever ``by`` asks for.
+        row_groups = pq.ParquetFile(self.path).metadata.num_row_groups
+        return [Partition(f"row group {i}", None, {"row_group": i}) for i in range(row_groups)]
+
+    def partition_batches(self, partition):
+        # A ParquetFile per partition, so threads never share a file handle.
+        return pq.ParquetFile(self.path).iter_batches(
+            batch_size=self.batch_size, row_groups=[partition.parameters["row_group"]])
+
+
+class CsvSource(DataSource):
+    def __init__(self, path, batch_size=BATCH_SIZE):
+        self.path = path
+        self.batch_size = batch_size
+
+    def __repr__(self):
+        return f"CsvSource({self.path!r})"
+
+    def batches(self):
+        # Keep the names as plain strings so whitespace variants survive until
+        # clean_table, exactly as they would coming from the warehouse.
+        convert_options = pacsv.ConvertOptions(
+            column_types={"departamento": pa.string(), "municipio": pa.string()}
+        )
+        read_options = pacsv.ReadOptions(block_size=1 << 24)
+        with pacsv.open_csv(self.path, read_options=read_options, convert_options=convert_options) as reader:
+            yield from reader
+
+
+class SQLiteSource(SqlSource):
+    def __init__(self, path, table="colombian_temperature_data", batch_size=BATCH_SIZE):
+        self.path = path
+        self.table = table
+        self.batch_size = batch_size
+
+    def __repr__(self):
+        return f"SQLiteSource({self.path!r}, table={self.table!r})"
+
+    def connect(self):
+        return sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, check_same_thread=False)
+
+    def run(self, connection, query, parameters=None):
+        cursor = connection.execute(query, parameters or {})
+        names = [desc[0] for desc in cursor.description]
+        while True:
+            rows = cursor.fetchmany(self.batch_size)
+            if not rows:
+                break
+            yield pa.RecordBatch.from_arrays([pa.array(column) for column in zip(*rows)], names=names)
+
+    def bind_timestamp(self, value):
+        return pd.Timestamp(value).strftime("%Y-%m-%d %H:%M:%S")
+
+    def bind_day(self, value):
+        return pd.Timestamp(value).strftime("%Y-%m-%d")
+
+    def timestamp(self, column):
+        # SQLite keeps dates as text; datetime() normalises whatever format they use.
+        return f"datetime({column})"
+
+    def day(self, column):
+        return f"date({column})"
+
+    def period_start(self, granularity, day):
+        if granularity == "D":
+            return day
+        if granularity == "W":
+            # The Monday on or before the previous day.
+            return f"date({day}, '-7 days', 'weekday 1')"
+        if granularity == "M":
+            return f"date({day}, 'start of month')"
+        if granularity == "Q":
+            return f"date({day}, 'start of month', printf('-%d months', (CAST(strftime('%m', {day}) AS INTEGER) - 1) % 3))"
+        return f"date({day}, 'start of year')"
+
+
+class DuckDBSource(SqlSource):
+    def __init__(self, path, table="colombian_temperature_data", batch_size=BATCH_SIZE):
+        self.path = path
+        self.table = table
+        self.batch_size = batch_size
+
+    def __repr__(self):
+        return f"DuckDBSource({self.path!r}, table={self.table!r})"
+
+    def connect(self):
+        import duckdb
+
+        return duckdb.connect(self.path, read_only=True)
+
+    def run(self, connection, query, parameters=None):
+        yield from connection.execute(query, parameters).fetch_record_batch(self.batch_size)
+
+    def param(self, name):
+        return f"${name}"
+
+
+FILE_SOURCES = {
+    ".parquet": ParquetSource,
+    ".pq": ParquetSource,
+    ".csv": CsvSource,
+    ".db": SQLiteSource,
+    ".sqlite": SQLiteSource,
+    ".sqlite3": SQLiteSource,
+    ".duckdb": DuckDBSource,
+}
+
+
+def open_source(location, table=None) -> DataSource:
+    """Open a local stand-in for the warehouse, chosen by file extension."""
+    extension = os.path.splitext(location)[1].lower()
+    if extension not in FILE_SOURCES:
+        raise ValueError(f"No data source for {location!r}; expected one of {sorted(FILE_SOURCES)}")
+    source_class = FILE_SOURCES[extension]
+    if table and source_class in (SQLiteSource, DuckDBSource):
+        return source_class(location, table=table)
+    return source_class(location)
+
+
+def source_from_env() -> DataSource:
+    """WEATHER_DATA_SOURCE points at a local file; otherwise read from Databricks."""
+    location = os.getenv("WEATHER_DATA_SOURCE")
+    if location:
+        source = open_source(location, table=os.getenv("WEATHER_DATA_TABLE"))
+    else:
+        source = DatabricksSource(
+            server_hostname=os.getenv("DATABRICKS_SERVER"),
+            http_path=os.getenv("DATABRICKS_HTTP_PATH"),
+            access_token=os.getenv("DATABRICKS_API_KEY"),
+        )
+    # Parallel bulk load: WEATHER_LOAD_PARTITION=year|departamento|none on WEATHER_LOAD_WORKERS threads.
+    partition_by = os.getenv("WEATHER_LOAD_PARTITION", "year")
+    source.partition_by = None if partition_by == "none" else partition_by
+    source.load_workers = int(os.getenv("WEATHER_LOAD_WORKERS", LOAD_WORKERS))
+    return source
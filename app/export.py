@@ -0,0 +1,208 @@
+import csv
+import hashlib
+import io
+import json
+from urllib.parse import quote
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+from flask import Blueprint, Response, jsonify, request, stream_with_context
+from werkzeug.http import is_resource_modified
+
+from cube import PERIOD_ENDS
+from metrics import REGISTRY
+from store import MEASURES
+
+
+FORMATS = {
+    "csv": "text/csv; charset=utf-8",
+    "jsonl": "application/x-ndjson",
+    "arrow": "application/vnd.apache.arrow.stream",
+}
+
+EXPORT_REQUESTS = REGISTRY.counter(
+    "weather_export_requests_total", "Export requests by format and HTTP status.", ["format", "status"])
+
+
+class BadRequest(ValueError):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def _parameters(data, args):
+    """The validated selection of an export request, in a fixed order."""
+    departamento = args.get("departamento", "")
+    municipio = args.get("municipio") or None
+    aggregation = args.get("aggregation", "M")
+    variable = args.get("variable", "temp_max")
+    fmt = args.get("format", "csv")
+    if aggregation not in PERIOD_ENDS:
+        raise BadRequest(f"aggregation must be one of {', '.join(PERIOD_ENDS)}")
+    if variable not in MEASURES:
+        raise BadRequest(f"variable must be one of {', '.join(MEASURES)}")
+    if fmt not in FORMATS:
+        raise BadRequest(f"format must be one of {', '.join(FORMATS)}")
+    municipios = data.store.municipios(departamento)
+    if not municipios:
+        raise BadRequest(f"Unknown departamento {departamento!r}", 404)
+    if municipio is not None and municipio not in municipios:
+        raise BadRequest(f"Unknown municipio {municipio!r} in {departamento!r}", 404)
+    try:
+        start = pd.Timestamp(args.get("start") or data.store.date_min).strftime("%Y-%m-%d")
+        end = pd.Timestamp(args.get("end") or data.store.date_max).strftime("%Y-%m-%d")
+    except ValueError:
+        raise BadRequest("start and end must be dates (YYYY-MM-DD)")
+    return {
+        "departamento": departamento, "municipio": municipio, "aggregation": aggregation,
+        "variable": variable, "start": start, "end": end, "format": fmt,
+    }
+
+
+def _etag(version, parameters):
+    digest = hashlib.blake2b(digest_size=12)
+    digest.update(version.encode())
+    digest.update(json.dumps(parameters, sort_keys=True).encode())
+    return digest.hexdigest()
+
+
+def series_chunks(cube, parameters):
+    """The selected period means as DataFrames, one municipio at a time.
+
+    Without a municipio, every municipio of the departamento comes from one
+    departamento_grid, the same slice the departamento view draws.
+    """
+    departamento, municipio = parameters["departamento"], parameters["municipio"]
+    aggregation, variable = parameters["aggregation"], parameters["variable"]
+    start, end = parameters["start"], parameters["end"]
+    if municipio is not None:
+        series = cube.series(aggregation, departamento, municipio, variable, start, end)
+        yield series.assign(departamento=departamento, municipio=municipio)[["departamento", "municipio", "date", variable]]
+        return
+
+    municipios, dates, grid = cube.departamento_grid(aggregation, departamento, variable, start, end)
+    for name, row in zip(municipios, grid):
+        present = ~np.isnan(row)
+        if present.any():
+            yield pd.DataFrame({"departamento": departamento, "municipio": name, "date": dates[present], variable: row[present]})
+
+
+def csv_stream(chunks, variable):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    writer.writerow(["departamento", "municipio", "date", variable])
+    for chunk in chunks:
+        writer.writerows(zip(chunk["departamento"], chunk["municipio"], chunk["date"].dt.strftime("%Y-%m-%d"), chunk[variable]))
+        yield buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
+
+
+def jsonl_stream(chunks, variable):
+    for chunk in chunks:
+        dates = chunk["date"].dt.strftime("%Y-%m-%d")
+        lines = [
+            json.dumps({"departamento": dep, "municipio": mun, "date": date, variable: value}, ensure_ascii=False)
+            for dep, mun, date, value in zip(chunk["departamento"], chunk["municipio"], dates, chunk[variable])
+        ]
+        yield ("\n".join(lines) + "\n").encode("utf-8")
+
+
+class _Pending(io.RawIOBase):
+    """A sink that hands back what the Arrow writer wrote since the last drain."""
+
+    def __init__(self):
+        self.parts = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        data = b"".join(self.parts)
+        self.parts.clear()
+        return data
+
+
+def arrow_stream(chunks, variable):
+    schema = pa.schema([
+        ("departamento", pa.string()), ("municipio", pa.string()),
+        ("date", pa.date32()), (variable, pa.float64()),
+    ])
+    sink = _Pending()
+    with pa.ipc.new_stream(pa.PythonFile(sink, mode="w"), schema) as writer:
+        yield sink.drain()
+        for chunk in chunks:
+            writer.write_batch(pa.RecordBatch.from_pandas(chunk, schema=schema, preserve_index=False))
+            yield sink.drain()
+    yield sink.drain()
+
+
+STREAMS = {"csv": csv_stream, "jsonl": jsonl_stream, "arrow": arrow_stream}
+
+
+def export_blueprint(live) -> Blueprint:
+    """Routes over ``live``'s current dataset, answered with 304 until its version changes."""
+    api = Blueprint("export", __name__, url_prefix="/api/v1")
+
+    @api.route("/catalog")
+    def catalog():
+        data = live.current
+        etag = _etag(data.version, {})
+        if not is_resource_modified(request.environ, etag=etag, last_modified=data.modified):
+            return _not_modified(etag, data, "json")
+        store = data.store
+        response = jsonify({
+            "version": data.version,
+            "date_min": store.date_min.date().isoformat(),
+            "date_max": store.date_max.date().isoformat(),
+            "aggregations": list(PERIOD_ENDS),
+            "variables": list(MEASURES),
+            "departamentos": {dep: store.municipios(dep) for dep in store.departamentos},
+        })
+        return _cacheable(response, etag, data, "json")
+
+    @api.route("/series")
+    def series():
+        # One dataset for the whole response, even if a refresh lands mid-stream
+        data = live.current
+        try:
+            parameters = _parameters(data, request.args)
+        except BadRequest as error:
+            # Unknown formats share a label, so requests cannot grow the metric
+            fmt = request.args.get("format", "csv")
+            EXPORT_REQUESTS.inc(format=fmt if fmt in FORMATS else "other", status=str(error.status))
+            return jsonify({"error": str(error)}), error.status
+
+        fmt = parameters["format"]
+        etag = _etag(data.version, parameters)
+        if not is_resource_modified(request.environ, etag=etag, last_modified=data.modified):
+            return _not_modified(etag, data, fmt)
+
+        chunks = series_chunks(data.cube, parameters)
+        body = STREAMS[fmt](chunks, parameters["variable"])
+        response = Response(stream_with_context(body), content_type=FORMATS[fmt])
+        name = "-".join(filter(None, [parameters["departamento"], parameters["municipio"], parameters["aggregation"], parameters["variable"]]))
+        response.headers["Content-Disposition"] = f"inline; filename*=UTF-8''{quote(name.replace(' ', '_'))}.{fmt}"
+        return _cacheable(response, etag, data, fmt)
+
+    return api
+
+
+def _cacheable(response, etag, data, fmt):
+    response.set_etag(etag)
+    response.last_modified = data.modified
+    # Clients may keep the body but must revalidate it on every poll
+    response.headers["Cache-Control"] = "no-cache"
+    EXPORT_REQUESTS.inc(format=fmt, status=str(response.status_code))
+    return response
+
+
+def _not_modified(etag, data, fmt):
+    return _cacheable(Response(status=304), etag, data, fmt)
@@ -0,0 +1,80 @@
+import base64
+
+import numpy as np
+import pandas as pd
+import plotly.io as pio
+
+
+def cumulative_frames(series: pd.DataFrame) -> pd.DataFrame:
+    """Stack the cumulative animation frames of a series in a single gather.
+
+    Frame i holds rows 0..i of ``series``; the result carries an ``id`` column
+    with the row position and a ``frame`` column with i, matching what the
+    evolution functions used to build with one copy + concat per frame.
+    """
+    n = len(series)
+    sizes = np.arange(1, n + 1)
+    frame = np.repeat(np.arange(n), sizes)
+    row = np.arange(sizes.sum()) - np.repeat(np.cumsum(sizes) - sizes, sizes)
+
+    columns = {name: series[name].to_numpy()[row] for name in series.columns if name not in ("id", "frame")}
+    columns["id"] = row
+    columns["frame"] = frame
+    return pd.DataFrame(columns)
+
+
+def epoch_ms(dates) -> np.ndarray:
+    """Dates as float milliseconds since the epoch, which a plotly.js date axis takes as is."""
+    return np.asarray(dates).astype("datetime64[ms]").astype("float64")
+
+
+def typed_array(values) -> dict:
+    """``values`` as a plotly.js typed array: float64 bytes in base64."""
+    values = np.ascontiguousarray(values, dtype="float64")
+    return {"dtype": "f8", "bdata": base64.b64encode(values.tobytes()).decode("ascii")}
+
+
+def single_frame(series: pd.DataFrame) -> pd.DataFrame:
+    """All of ``series`` as frame 0, for ``compact_json`` to animate in the browser."""
+    return series.assign(id=np.arange(len(series)), frame=0)
+
+
+# Where px puts the Play/Pause buttons of an animation, under the slider it
+# adds with the step for frame "0"; the browser repeats the step for every
+# frame it rebuilds.
+UPDATEMENU = {"direction": "left", "pad": {"r": 10, "t": 70}, "x": 0.1, "xanchor": "right", "y": 0, "yanchor": "top"}
+SLIDER = {
+    "active": 0, "currentvalue": {"prefix": "frame="}, "len": 0.9, "pad": {"b": 10, "t": 60},
+    "x": 0.1, "xanchor": "left", "y": 0, "yanchor": "top",
+    "steps": [{
+        "args": [["0"], {"frame": {"duration": 0, "redraw": False}, "mode": "immediate", "fromcurrent": True,
+                         "transition": {"duration": 0, "easing": "linear"}}],
+        "label": "0", "method": "animate",
+    }],
+}
+
+
+def compact_json(fig) -> str:
+    """Serialize a figure built from ``single_frame`` without its cumulative frames.
+
+    The series goes out once, dates as epoch milliseconds so that every point
+    array is a binary typed array, and ``animation.count`` tells
+    assets/figures.js to rebuild frame i in the browser as views of points
+    0..i. That keeps the payload linear in the series length instead of
+    quadratic.
+    """
+    trace = fig.data[0] if fig.data else None
+    # Only the animated scatter of the evolution charts has frames to spare
+    if trace is None or trace.type != "scatter" or trace.x is None:
+        return fig.to_json()
+    if np.issubdtype(np.asarray(trace.x).dtype, np.datetime64):
+        trace.x = epoch_ms(trace.x)
+    if trace.hovertemplate:
+        trace.hovertemplate = trace.hovertemplate.replace("frame=0<br>", "")
+    fig.update_layout(
+        updatemenus=[{**UPDATEMENU, **menu.to_plotly_json()} for menu in fig.layout.updatemenus],
+        sliders=[SLIDER],
+    )
+    figure = fig.to_plotly_json()
+    figure["animation"] = {"count": len(trace.x)}
+    return pio.json.to_json_plotly(figure)
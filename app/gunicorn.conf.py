@@ -0,0 +1,29 @@
+# Production server: gunicorn -c gunicorn.conf.py app:server
+#
+# Workers do not share Python objects, so each one maps the same Arrow
+# snapshot instead of loading its own copy of the table (see
+# dataset.start_shared). The snapshot is written here, in the master, before
+# any worker starts.
+import os
+import tempfile
+
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8050')}"
+workers = int(os.getenv("WEATHER_WORKERS", "2"))
+# One thread per worker by default: plotly express is not thread-safe (its
+# default template is filled in lazily), and the GIL would serialize the
+# figure building anyway, so concurrency comes from the workers.
+threads = int(os.getenv("WEATHER_THREADS", "1"))
+timeout = int(os.getenv("WEATHER_WORKER_TIMEOUT", "120"))
+
+os.environ.setdefault("WEATHER_SNAPSHOT_DIR", os.path.join(tempfile.gettempdir(), "weather-snapshots"))
+os.environ.setdefault("WEATHER_SHARED_SNAPSHOT", "1")
+
+
+def on_starting(server):
+    if os.getenv("WEATHER_QUERY_MODE", "memory") == "pushdown":
+        return
+    from datasource import source_from_env
+    from dataset import ensure_snapshot
+
+    ensure_snapshot(source_from_env(), os.environ["WEATHER_SNAPSHOT_DIR"])
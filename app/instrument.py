@@ -0,0 +1,111 @@
+import contextvars
+import cProfile
+import functools
+import itertools
+import logging
+import os
+import threading
+import time
+
+from metrics import BYTES_BUCKETS, REGISTRY, ROWS_BUCKETS
+
+
+log = logging.getLogger(__name__)
+
+# WEATHER_METRICS=0 turns the instrumentation off entirely: ``instrumented``
+# returns the callback untouched and ``lap`` finds no trace and returns.
+ENABLED = os.getenv("WEATHER_METRICS", "1") != "0"
+# With a directory, every instrumented call is profiled and dumped there.
+PROFILE_DIR = os.getenv("WEATHER_PROFILE_DIR") or None
+
+CALLBACK_SECONDS = REGISTRY.histogram(
+    "weather_callback_seconds", "Wall time of each callback invocation.", ["callback"])
+CALLBACK_ERRORS = REGISTRY.counter(
+    "weather_callback_errors_total", "Callback invocations that raised.", ["callback"])
+STAGE_SECONDS = REGISTRY.histogram(
+    "weather_callback_stage_seconds", "Wall time of each stage of a callback.", ["callback", "stage"])
+STAGE_ROWS = REGISTRY.histogram(
+    "weather_callback_stage_rows", "Rows produced by a callback stage.", ["callback", "stage"], ROWS_BUCKETS)
+PAYLOAD_BYTES = REGISTRY.histogram(
+    "weather_callback_payload_bytes", "Serialized size of what a callback built.", ["callback"], BYTES_BUCKETS)
+
+_trace = contextvars.ContextVar("trace", default=None)
+# Only one cProfile profiler can be active per process at a time.
+_profile_lock = threading.Lock()
+_profile_ids = itertools.count()
+
+
+class Trace:
+    """The stages of one callback invocation, as consecutive laps."""
+
+    __slots__ = ("callback", "started", "last", "stages")
+
+    def __init__(self, callback):
+        self.callback = callback
+        self.started = self.last = time.perf_counter()
+        self.stages = []
+
+    def lap(self, stage, rows=None, payload_bytes=None):
+        now = time.perf_counter()
+        self.stages.append((stage, now - self.last, rows, payload_bytes))
+        self.last = now
+
+    def record(self, failed=False):
+        total = time.perf_counter() - self.started
+        CALLBACK_SECONDS.observe(total, callback=self.callback)
+        if failed:
+            CALLBACK_ERRORS.inc(callback=self.callback)
+        for stage, seconds, rows, payload_bytes in self.stages:
+            STAGE_SECONDS.observe(seconds, callback=self.callback, stage=stage)
+            if rows is not None:
+                STAGE_ROWS.observe(rows, callback=self.callback, stage=stage)
+            if payload_bytes is not None:
+                PAYLOAD_BYTES.observe(payload_bytes, callback=self.callback)
+        if log.isEnabledFor(logging.DEBUG):
+            laps = ", ".join(f"{stage} {seconds * 1000:.1f} ms" for stage, seconds, _, _ in self.stages)
+            log.debug("%s %.1f ms: %s", self.callback, total * 1000, laps)
+
+
+def lap(stage, rows=None, payload_bytes=None):
+    """Close ``stage`` of the running callback: the time since the previous lap."""
+    trace = _trace.get()
+    if trace is not None:
+        trace.lap(stage, rows, payload_bytes)
+
+
+def _dump_profile(profiler, callback):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    stamp = time.strftime("%Y%m%dT%H%M%S")
+    profiler.dump_stats(os.path.join(PROFILE_DIR, f"{callback}-{stamp}-{os.getpid()}-{next(_profile_ids)}.prof"))
+
+
+def instrumented(callback):
+    """Decorate a Dash callback so its stages and totals are recorded."""
+    def decorate(fn):
+        if not ENABLED:
+            return fn
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            trace = Trace(callback)
+            token = _trace.set(trace)
+            # Concurrent requests are not profiled while another one is.
+            profiler = None
+            if PROFILE_DIR and _profile_lock.acquire(blocking=False):
+                profiler = cProfile.Profile()
+                profiler.enable()
+            failed = True
+            try:
+                result = fn(*args, **kwargs)
+                failed = False
+                return result
+            finally:
+                if profiler is not None:
+                    profiler.disable()
+                    _profile_lock.release()
+                    _dump_profile(profiler, callback)
+                _trace.reset(token)
+                trace.record(failed)
+
+        return wrapper
+    return decorate
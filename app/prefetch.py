@@ -0,0 +1,153 @@
+import fcntl
+import functools
+import json
+import logging
+import os
+import queue
+import tempfile
+import threading
+from collections import Counter
+
+from metrics import REGISTRY
+
+
+log = logging.getLogger(__name__)
+
+PREFETCH_TASKS = REGISTRY.counter(
+    "weather_prefetch_tasks_total", "Background figure builds, by kind and outcome.", ["kind", "result"])
+PREFETCH_PENDING = REGISTRY.gauge(
+    "weather_prefetch_pending", "Background figure builds waiting for a thread.")
+
+
+class SelectionLog:
+    """How often each selection was requested, to warm the most popular first.
+
+    Counts are kept in memory and, with a ``path``, merged into a JSON file on
+    ``save``, so they survive restarts and add up across the worker processes
+    sharing the file.
+    """
+
+    def __init__(self, path=None, max_entries=2000):
+        self.path = path
+        self.max_entries = max_entries
+        self._saved = Counter()
+        self._pending = Counter()
+        self._lock = threading.Lock()
+        if path:
+            self._saved = self._read()
+
+    def record(self, selection):
+        with self._lock:
+            self._pending[tuple(selection)] += 1
+
+    def counts(self) -> Counter:
+        with self._lock:
+            return self._saved + self._pending
+
+    def top(self, n):
+        """The ``n`` most requested selections, most requested first."""
+        return [selection for selection, _ in self.counts().most_common(n)]
+
+    def municipio_counts(self, departamento) -> Counter:
+        """Requests for each municipio of ``departamento``, whatever the rest of the selection."""
+        counts = Counter()
+        for (_, selected, municipio, *_), n in self.counts().items():
+            if selected == departamento and municipio is not None:
+                counts[municipio] += n
+        return counts
+
+    def save(self):
+        """Add the counts recorded since the last save to the file."""
+        if not self.path:
+            return
+        with self._lock:
+            pending, self._pending = self._pending, Counter()
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.path + ".lock", "a") as lock:
+            # Other workers merge into the same file; one at a time.
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            counts = self._read() + pending
+            counts = Counter(dict(counts.most_common(self.max_entries)))
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(self.path) or ".", suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump([[list(selection), n] for selection, n in counts.items()], f, ensure_ascii=False)
+            os.replace(tmp, self.path)
+        with self._lock:
+            self._saved = counts
+
+    def _read(self) -> Counter:
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                return Counter({tuple(selection): n for selection, n in json.load(f)})
+        except (FileNotFoundError, ValueError, TypeError):
+            return Counter()
+
+
+class Prefetcher:
+    """Runs figure builds ahead of requests on ``workers`` background threads.
+
+    Tasks never overlap a ``foreground`` callback: one starts only while no
+    callback is running, and a callback arriving meanwhile waits for that
+    one task, not for the queue. Besides keeping the live callbacks ahead,
+    this keeps plotly express, which is not thread-safe, on one thread at a
+    time. At most ``max_pending`` tasks wait in line; further ones are
+    dropped. Tasks return the outcome counted in weather_prefetch_tasks_total.
+    """
+
+    def __init__(self, workers=1, max_pending=64):
+        self.enabled = workers > 0
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._turn = threading.Condition()
+        self._active = 0
+        self._running = 0
+        for i in range(workers):
+            threading.Thread(target=self._run, name=f"prefetch-{i}", daemon=True).start()
+
+    def submit(self, kind, task) -> bool:
+        if not self.enabled:
+            return False
+        try:
+            self._queue.put_nowait((kind, task))
+        except queue.Full:
+            PREFETCH_TASKS.inc(kind=kind, result="dropped")
+            return False
+        PREFETCH_PENDING.set(self._queue.qsize())
+        return True
+
+    def foreground(self, callback):
+        """Decorate a live callback so background tasks hold off while it runs."""
+        @functools.wraps(callback)
+        def wrapper(*args, **kwargs):
+            with self._turn:
+                self._active += 1
+                self._turn.wait_for(lambda: not self._running)
+            try:
+                return callback(*args, **kwargs)
+            finally:
+                with self._turn:
+                    self._active -= 1
+                    self._turn.notify_all()
+        return wrapper
+
+    def join(self):
+        """Wait until every submitted task has run."""
+        self._queue.join()
+
+    def _run(self):
+        while True:
+            kind, task = self._queue.get()
+            PREFETCH_PENDING.set(self._queue.qsize())
+            with self._turn:
+                # One task at a time, and only while no callback runs or waits.
+                self._turn.wait_for(lambda: not self._active and not self._running)
+                self._running += 1
+            try:
+                PREFETCH_TASKS.inc(kind=kind, result=task())
+            except Exception:
+                PREFETCH_TASKS.inc(kind=kind, result="error")
+                log.exception("Prefetch (%s) failed", kind)
+            finally:
+                with self._turn:
+                    self._running -= 1
+                    self._turn.notify_all()
+                self._queue.task_done()
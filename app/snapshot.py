@@ -0,0 +1,185 @@
+import datetime
+import json
+import os
+import tempfile
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.ipc as ipc
+
+
+# Bump whenever the layout written by write_snapshot changes; older files are ignored.
+SCHEMA_VERSION = 2
+CURRENT = "CURRENT"
+PREFIX = "temperature-"
+ROLLUP_PREFIX = "rollup-"
+SUFFIX = ".arrow"
+
+
+class Snapshot:
+    """A cleaned temperature table saved as an uncompressed Arrow IPC file.
+
+    Uncompressed IPC can be memory-mapped, so loading a snapshot reads the
+    columns straight out of the page cache instead of parsing anything. The
+    rollup cube's tables, when saved, sit next to it in files of their own.
+    """
+
+    def __init__(self, path, table: pa.Table, rollups=None):
+        metadata = table.schema.metadata or {}
+        self.path = path
+        self.name = os.path.basename(path)
+        self.table = table
+        self.version = metadata.get(b"weather.version", b"").decode()
+        self.created = metadata.get(b"weather.created", b"").decode()
+        self.origin = metadata.get(b"weather.origin", b"").decode()
+        self.rollups = rollups or {}
+
+    def __repr__(self):
+        return f"Snapshot({self.name!r}, created={self.created!r})"
+
+    def to_dataframe(self) -> pd.DataFrame:
+        """The table as read-only views on the mapped file, nothing copied."""
+        return table_frame(self.table)
+
+    def rollup_frames(self):
+        """The saved cube tables as ``{granularity: frame}``, views like to_dataframe."""
+        return {g: table_frame(table) for g, table in self.rollups.items()}
+
+    def describe(self):
+        return {
+            "name": self.name,
+            "version": self.version,
+            "created": self.created,
+            "origin": self.origin,
+            "rows": self.table.num_rows,
+        }
+
+
+def arrow_table(frame: pd.DataFrame, metadata) -> pa.Table:
+    # Built from the numpy arrays rather than with Table.from_pandas, which
+    # would turn NaN into nulls: a column with a validity bitmap cannot be
+    # handed back to numpy without copying it.
+    columns = {}
+    for name, column in frame.items():
+        if isinstance(column.dtype, pd.CategoricalDtype):
+            columns[name] = pa.DictionaryArray.from_arrays(
+                column.cat.codes.to_numpy(), pa.array(column.cat.categories.to_numpy(dtype=object)))
+        else:
+            columns[name] = pa.array(column.to_numpy())
+    return pa.table(columns).replace_schema_metadata(metadata)
+
+
+def table_frame(table: pa.Table) -> pd.DataFrame:
+    """A DataFrame of views on ``table``'s buffers, with dictionary columns as categoricals."""
+    columns = {}
+    for name, column in zip(table.column_names, table.columns):
+        array = column.combine_chunks() if column.num_chunks != 1 else column.chunk(0)
+        if pa.types.is_dictionary(array.type):
+            columns[name] = pd.Categorical.from_codes(
+                array.indices.to_numpy(zero_copy_only=False), array.dictionary.to_pylist())
+        else:
+            columns[name] = array.to_numpy(zero_copy_only=False)
+    return pd.DataFrame(columns, copy=False)
+
+
+def _replace_atomically(directory, name, write):
+    fd, tmp = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            write(f)
+        os.replace(tmp, os.path.join(directory, name))
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def write_snapshot(store, directory, origin="", cube=None, created=None) -> str:
+    """Save the store's table, and the cube's if given, and make them the current snapshot.
+
+    ``created`` (a UTC datetime, now by default) is recorded as the time the
+    data was saved.
+    """
+    os.makedirs(directory, exist_ok=True)
+    created = (created or datetime.datetime.now(datetime.timezone.utc)).isoformat(timespec="seconds")
+    metadata = {
+        b"weather.schema_version": str(SCHEMA_VERSION).encode(),
+        b"weather.version": store.version.encode(),
+        b"weather.created": created.encode(),
+        b"weather.origin": origin.encode(),
+    }
+
+    name = f"{PREFIX}{store.version}{SUFFIX}"
+    files = {name: arrow_table(store.frame, metadata)}
+    rollups = {}
+    for granularity, table in (cube.tables.items() if cube is not None else ()):
+        rollups[granularity] = f"{ROLLUP_PREFIX}{store.version}-{granularity}{SUFFIX}"
+        files[rollups[granularity]] = arrow_table(table["frame"], metadata)
+
+    def write_table(table):
+        def write(f):
+            with ipc.new_file(f, table.schema) as writer:
+                writer.write_table(table)
+        return write
+
+    def write_pointer(f):
+        f.write(json.dumps({"name": name, "version": store.version, "created": created, "rollups": rollups}).encode())
+
+    # The data files go first, so CURRENT never names a file that is not there.
+    for file_name, table in files.items():
+        _replace_atomically(directory, file_name, write_table(table))
+    _replace_atomically(directory, CURRENT, write_pointer)
+    _prune(directory, keep=set(files))
+    return os.path.join(directory, name)
+
+
+def _prune(directory, keep):
+    # Processes that still map an older file keep their pages after the unlink.
+    for name in os.listdir(directory):
+        if name.startswith((PREFIX, ROLLUP_PREFIX)) and name.endswith(SUFFIX) and name not in keep:
+            try:
+                os.unlink(os.path.join(directory, name))
+            except FileNotFoundError:
+                pass
+
+
+def _pointer(directory):
+    with open(os.path.join(directory, CURRENT), encoding="utf-8") as f:
+        return json.load(f)
+
+
+def current_version(directory):
+    """The data version CURRENT points at, without mapping anything; None if there is none."""
+    try:
+        return _pointer(directory)["version"]
+    except (FileNotFoundError, KeyError, ValueError):
+        return None
+
+
+def _map(path):
+    table = ipc.open_file(pa.memory_map(path, "r")).read_all()
+    stamp = (table.schema.metadata or {}).get(b"weather.schema_version")
+    return table if stamp == str(SCHEMA_VERSION).encode() else None
+
+
+def read_snapshot(directory):
+    """Memory-map the current snapshot, or return None if there is no usable one.
+
+    Missing or stale rollup files only cost the cube: the snapshot comes back
+    without rollups and the cube is rebuilt from the table.
+    """
+    try:
+        pointer = _pointer(directory)
+        path = os.path.join(directory, pointer["name"])
+        table = _map(path)
+    except (FileNotFoundError, KeyError, ValueError, pa.ArrowInvalid):
+        return None
+    if table is None:
+        return None
+
+    try:
+        rollups = {g: _map(os.path.join(directory, name)) for g, name in pointer.get("rollups", {}).items()}
+    except (FileNotFoundError, pa.ArrowInvalid):
+        rollups = {}
+    if any(t is None for t in rollups.values()):
+        rollups = {}
+    return Snapshot(path, table, rollups)
@@ -0,0 +1,184 @@
+import hashlib
+
+import numpy as np
+import pandas as pd
+
+
+MEASURES = ["temp_min", "temp_avg", "temp_max", "precipitacion_total"]
+
+
+def _row_order(keys, values, measures):
+    """The order sorting rows by ``keys`` (as np.lexsort takes them), ties broken by the measures.
+
+    Several stations can report for a municipio on the same day. Ordering
+    those rows by their measures too makes the sort total, so the layout and
+    the version do not depend on the order the source returned the rows in.
+    Only the tied rows, a few thousand, are sorted again.
+    """
+    order = np.lexsort(keys)
+    if len(order) < 2:
+        return order
+    same = np.ones(len(order) - 1, dtype=bool)
+    for key in keys:
+        ranked = key[order]
+        same &= ranked[1:] == ranked[:-1]
+    tied = np.zeros(len(order), dtype=bool)
+    tied[:-1] |= same
+    tied[1:] |= same
+    # Tied groups keep their positions; each is sorted within itself.
+    rows = order[tied]
+    order[tied] = rows[np.lexsort((*[values[name][rows] for name in reversed(measures)], *[key[rows] for key in keys]))]
+    return order
+
+
+def complete_rows(frame):
+    """``frame`` without the rows missing their departamento, municipio or date, which no chart can place."""
+    complete = frame["departamento"].notna() & frame["municipio"].notna() & frame["date"].notna()
+    return frame if complete.all() else frame[complete]
+
+
+class TemperatureStore:
+    """The cleaned temperature table laid out for per-municipio lookups.
+
+    Rows are sorted by (departamento, municipio, date), then by the measures,
+    with categorical names and float32 measures, so every municipio occupies
+    one contiguous block and a lookup is a slice through ``offsets`` instead
+    of a scan of the table. Rows without a departamento, municipio or date
+    are left out.
+    """
+
+    def __init__(self, frame: pd.DataFrame):
+        frame = complete_rows(frame)
+        measures = [m for m in MEASURES if m in frame.columns]
+
+        departamento = pd.Categorical(frame["departamento"])
+        municipio = pd.Categorical(frame["municipio"])
+        date = frame["date"].to_numpy(dtype="datetime64[ns]")
+        values = {name: frame[name].to_numpy(dtype=np.float32) for name in measures}
+        order = _row_order((date, municipio.codes, departamento.codes), values, measures)
+
+        columns = {
+            "departamento": departamento.take(order),
+            "municipio": municipio.take(order),
+            "date": date[order],
+        }
+        for name in measures:
+            columns[name] = values[name][order]
+        self._index(measures, columns)
+
+    @classmethod
+    def _from_sorted(cls, measures, columns, version=None):
+        store = cls.__new__(cls)
+        store._index(measures, columns, version)
+        return store
+
+    @classmethod
+    def from_sorted_frame(cls, frame: pd.DataFrame, version=None) -> "TemperatureStore":
+        """A store over ``frame`` as it is, already sorted and typed like ``self.frame``.
+
+        The columns are not copied, so a frame of views on a memory-mapped
+        snapshot stays in the page cache, shared by every process that maps it.
+        """
+        measures = [m for m in MEASURES if m in frame.columns]
+        return cls._from_sorted(measures, dict(frame.items()), version)
+
+    def _index(self, measures, columns, version=None):
+        self.measures = measures
+        self.frame = pd.DataFrame(columns, copy=False)
+        departamento = self.frame["departamento"].cat
+        municipio = self.frame["municipio"].cat
+
+        self.offsets = {}
+        self.municipios_by_departamento = {}
+        dep_codes = departamento.codes.to_numpy()
+        mun_codes = municipio.codes.to_numpy()
+        changes = (np.diff(dep_codes) != 0) | (np.diff(mun_codes) != 0)
+        starts = np.concatenate(([0], np.flatnonzero(changes) + 1)) if len(self.frame) else np.empty(0, dtype=np.int64)
+        stops = np.concatenate((starts[1:], [len(self.frame)]))
+        for start, stop in zip(starts.tolist(), stops.tolist()):
+            dep = departamento.categories[dep_codes[start]]
+            mun = municipio.categories[mun_codes[start]]
+            self.offsets[(dep, mun)] = (start, stop)
+            # Categories are sorted, so the lists come out in alphabetical order.
+            self.municipios_by_departamento.setdefault(dep, []).append(mun)
+
+        self.departamentos = list(self.municipios_by_departamento)
+        self.municipio_options = {
+            dep: [{'label': i, 'value': i} for i in municipios]
+            for dep, municipios in self.municipios_by_departamento.items()
+        }
+        date = np.asarray(columns["date"])
+        date = date[~np.isnat(date)]
+        self.date_min = pd.Timestamp(date.min()) if len(date) else None
+        self.date_max = pd.Timestamp(date.max()) if len(date) else None
+        self.version = version or self._fingerprint()
+
+    def _fingerprint(self):
+        digest = hashlib.blake2b(digest_size=8)
+        for name in ("departamento", "municipio"):
+            digest.update("\0".join(self.frame[name].cat.categories).encode())
+            digest.update(self.frame[name].cat.codes.to_numpy().tobytes())
+        for name in ["date"] + self.measures:
+            digest.update(self.frame[name].to_numpy().tobytes())
+        return digest.hexdigest()
+
+    def append(self, frame: pd.DataFrame) -> "TemperatureStore":
+        """A new store with the rows of ``frame`` merged in.
+
+        ``frame`` may only hold dates after ``date_max``, so every new row goes
+        at the end of its municipio's block: the existing rows keep their
+        order and the merge is one ``np.insert`` per column instead of a sort.
+        """
+        frame = complete_rows(frame)
+        if not len(frame):
+            return self
+        if not len(self.frame):
+            return TemperatureStore(frame)
+
+        columns = {}
+        for name in ("departamento", "municipio"):
+            current = self.frame[name].cat
+            categories = current.categories.union(pd.Index(frame[name].unique()))
+            # The union is sorted, so recoding keeps the existing rows sorted too.
+            columns[name] = (
+                pd.Categorical(self.frame[name]).set_categories(categories),
+                pd.Categorical(frame[name], categories=categories),
+            )
+        n_municipios = len(columns["municipio"][0].categories)
+        old_key = columns["departamento"][0].codes.astype(np.int64) * n_municipios + columns["municipio"][0].codes
+        new_key = columns["departamento"][1].codes.astype(np.int64) * n_municipios + columns["municipio"][1].codes
+
+        date = frame["date"].to_numpy(dtype="datetime64[ns]")
+        values = {name: frame[name].to_numpy(dtype=np.float32) for name in self.measures}
+        order = _row_order((date, new_key), values, self.measures)
+        positions = np.searchsorted(old_key, new_key[order], side="right")
+
+        merged = {}
+        for name in ("departamento", "municipio"):
+            old, new = columns[name]
+            codes = np.insert(old.codes, positions, new.codes[order])
+            merged[name] = pd.Categorical.from_codes(codes, dtype=old.dtype)
+        merged["date"] = np.insert(self.frame["date"].to_numpy(), positions, date[order])
+        for name in self.measures:
+            merged[name] = np.insert(self.frame[name].to_numpy(), positions, values[name][order])
+        return TemperatureStore._from_sorted(list(self.measures), merged)
+
+    def key_positions(self, departamento, municipio) -> np.ndarray:
+        """Position in ``offsets`` of each (departamento, municipio) pair, -1 if absent."""
+        keys = pd.MultiIndex.from_tuples(list(self.offsets), names=["departamento", "municipio"])
+        pairs = pd.MultiIndex.from_arrays([np.asarray(departamento, dtype=object), np.asarray(municipio, dtype=object)])
+        return keys.get_indexer(pairs)
+
+    def __len__(self):
+        return len(self.frame)
+
+    def municipios(self, departamento):
+        return self.municipios_by_departamento.get(departamento, [])
+
+    def municipio(self, departamento, municipio) -> pd.DataFrame:
+        """Rows of one municipio, sorted by date, as a view on the store."""
+        start, stop = self.offsets.get((departamento, municipio), (0, 0))
+        return self.frame.iloc[start:stop]
+
+    def memory_usage(self):
+        return int(self.frame.memory_usage(deep=True).sum())
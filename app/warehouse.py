@@ -0,0 +1,211 @@
+import datetime
+import hashlib
+import logging
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from cube import PERIOD_ENDS, period_grid, valid_means
+from datasource import SqlSource, clean_names
+from store import MEASURES
+
+
+log = logging.getLogger(__name__)
+
+# pandas frequency of each granularity, used to find where a period starts.
+PERIOD_FREQ = {"D": "D", "W": "W-MON", "M": "M", "Q": "Q", "A": "Y"}
+
+
+def _clean(column):
+    # The same cleaning clean_table applies after a bulk load.
+    return f"TRIM(REPLACE({column}, 'SAN ANDRES Y  PROVIDENCIA', 'SAN ANDRES Y PROVIDENCIA'))"
+
+
+def _matches(source, column, name, values):
+    # An equality (IN for several spellings) on the stored column, so the
+    # warehouse can still skip files by that column's statistics.
+    if len(values) == 1:
+        return f"{column} = {source.param(f'{name}_0')}"
+    return f"{column} IN ({', '.join(source.param(f'{name}_{i}') for i in range(len(values)))})"
+
+
+class WarehouseCatalog:
+    """The parts of TemperatureStore the layout and dropdowns need, read with one query.
+
+    Names are cleaned like the bulk load cleans them. ``raw_departamentos``
+    and ``raw_municipios`` keep the spellings stored for each clean name, so
+    queries can filter on the stored columns as they are.
+    """
+
+    def __init__(self, source: SqlSource):
+        frame = source.query(
+            f"SELECT departamento, municipio, MIN(date) AS date_min, MAX(date) AS date_max, COUNT(*) AS n "
+            f"FROM {source.table} GROUP BY 1, 2"
+        )
+        if frame.empty:
+            raise ValueError(f"{source!r} returned no data")
+        raw = frame[["departamento", "municipio"]]
+        departamento, municipio = clean_names(pa.array(raw["departamento"], type=pa.string()),
+                                              pa.array(raw["municipio"], type=pa.string()))
+        frame = pd.DataFrame({
+            "departamento": departamento.to_pandas(), "municipio": municipio.to_pandas(),
+            "raw_departamento": raw["departamento"], "raw_municipio": raw["municipio"],
+            "date_min": pd.to_datetime(frame["date_min"]), "date_max": pd.to_datetime(frame["date_max"]),
+            "n": frame["n"],
+        })
+        self.raw_departamentos = {
+            dep: sorted(group.unique()) for dep, group in frame.groupby("departamento")["raw_departamento"]
+        }
+        self.raw_municipios = {
+            key: sorted(group.unique()) for key, group in frame.groupby(["departamento", "municipio"])["raw_municipio"]
+        }
+        # Spellings that clean to the same names are one municipio.
+        frame = (frame.groupby(["departamento", "municipio"], dropna=False, sort=False)
+                 .agg(date_min=("date_min", "min"), date_max=("date_max", "max"), n=("n", "sum")))
+        frame = frame.reset_index().sort_values(["departamento", "municipio"], ignore_index=True)
+
+        self.rows = int(frame["n"].sum())
+        self.municipios_by_departamento = {
+            dep: group["municipio"].tolist() for dep, group in frame.groupby("departamento", sort=False)
+        }
+        self.departamentos = list(self.municipios_by_departamento)
+        self.municipio_options = {
+            dep: [{'label': i, 'value': i} for i in municipios]
+            for dep, municipios in self.municipios_by_departamento.items()
+        }
+        self.date_min = frame["date_min"].min()
+        self.date_max = frame["date_max"].max()
+
+        # Rows per municipio and their last date change whenever data lands.
+        digest = hashlib.blake2b(digest_size=8)
+        digest.update(pd.util.hash_pandas_object(frame[["departamento", "municipio", "date_max", "n"]], index=False).to_numpy().tobytes())
+        self.version = digest.hexdigest()
+
+    def __len__(self):
+        return self.rows
+
+    def municipios(self, departamento):
+        return self.municipios_by_departamento.get(departamento, [])
+
+
+class WarehouseCube:
+    """Answers RollupCube.series with an aggregation that runs in the warehouse.
+
+    The municipio and date predicates and the GROUP BY over periods are sent
+    as one parameterized query, so only one row per period comes back.
+    """
+
+    def __init__(self, source: SqlSource, catalog: WarehouseCatalog):
+        self.source = source
+        self.catalog = catalog
+
+    def sql(self, granularity, variable, per_municipio=False, departamentos=("",), municipios=("",)):
+        """The aggregation of one municipio, or of every municipio of the departamento.
+
+        ``departamentos`` and ``municipios`` are the stored spellings the query
+        is bound to, as parameters departamento_0, departamento_1... and
+        municipio_0...
+        """
+        if granularity not in PERIOD_ENDS:
+            raise ValueError(f"Unknown granularity {granularity!r}")
+        if variable not in MEASURES:
+            raise ValueError(f"Unknown variable {variable!r}")
+        source = self.source
+        day = source.day("date")
+        if per_municipio:
+            select, municipio, where, group = f"{_clean('municipio')} AS municipio, ", "municipio, ", "", "1, 2"
+        else:
+            select, municipio, where, group = "", "", f"AND {_matches(source, 'municipio', 'municipio', municipios)} ", "1"
+        # Stations reporting on the same day are averaged first, as in the cube.
+        return (
+            f"WITH daily AS ("
+            f"SELECT {select}{day} AS day, AVG({variable}) AS value FROM {source.table} "
+            f"WHERE {_matches(source, 'departamento', 'departamento', departamentos)} "
+            f"{where}"
+            f"AND {day} >= {source.param('start')} AND {day} <= {source.param('end')} "
+            f"GROUP BY {group}) "
+            f"SELECT {municipio}{source.period_start(granularity, 'day')} AS period, SUM(value) AS total, COUNT(value) AS n "
+            f"FROM daily GROUP BY {group} ORDER BY {group}"
+        )
+
+    def _query(self, granularity, variable, departamento, min_date, max_date, municipio=None):
+        # A period is plotted when its label (its last day) is in range, and its
+        # mean covers the whole period, so fetch from the start of the first one.
+        start = pd.Period(min_date, PERIOD_FREQ[granularity]).start_time
+        departamentos = self.catalog.raw_departamentos.get(departamento, [])
+        municipios = self.catalog.raw_municipios.get((departamento, municipio), []) if municipio is not None else [""]
+        parameters = {
+            **{f"departamento_{i}": name for i, name in enumerate(departamentos)},
+            **{f"municipio_{i}": name for i, name in enumerate(municipios) if municipio is not None},
+            "start": self.source.bind_day(start),
+            "end": self.source.bind_day(max_date),
+        }
+        if departamentos and municipios:
+            rows = self.source.query(self.sql(granularity, variable, municipio is None, departamentos, municipios), parameters)
+        else:
+            # Not in the catalog: nothing to ask the warehouse for.
+            rows = pd.DataFrame()
+        if rows.empty:
+            return rows, np.empty(0, dtype="datetime64[ns]"), np.empty(0)
+
+        period = pd.to_datetime(rows["period"]).to_numpy().astype("datetime64[D]")
+        if granularity == "W":
+            period = period + np.timedelta64(1, "D")
+        label = PERIOD_ENDS[granularity](period).astype("datetime64[ns]")
+        means = valid_means(variable, rows["total"].to_numpy(dtype=np.float64), rows["n"].to_numpy(dtype=np.float64))
+        keep = ~np.isnan(means) & (label >= min_date) & (label <= max_date)
+        return rows.loc[keep], label[keep], means[keep]
+
+    def series(self, granularity, departamento, municipio, variable, min_date, max_date) -> pd.DataFrame:
+        """Valid period means of one variable between min_date and max_date."""
+        min_date, max_date = pd.to_datetime(min_date), pd.to_datetime(max_date)
+        _, label, means = self._query(granularity, variable, departamento, min_date, max_date, municipio)
+        return pd.DataFrame({"date": label, variable: means})
+
+    def departamento_grid(self, granularity, departamento, variable, min_date, max_date):
+        """RollupCube.departamento_grid, grouped by municipio and period in one query."""
+        min_date, max_date = pd.to_datetime(min_date), pd.to_datetime(max_date)
+        rows, label, means = self._query(granularity, variable, departamento, min_date, max_date)
+        municipios, codes = np.unique(rows["municipio"].to_numpy(dtype=object), return_inverse=True) if len(rows) else ([], [])
+        return period_grid(municipios, codes, label, means)
+
+
+class WarehouseDataset:
+    """Stands in for Dataset when the table stays in the warehouse.
+
+    ``store`` is a WarehouseCatalog and ``cube`` a WarehouseCube, so the
+    callbacks work unchanged; nothing but the catalog is held in memory.
+    There is no climatology, so the anomaly view is not available.
+    """
+
+    def __init__(self, source: SqlSource):
+        if not isinstance(source, SqlSource):
+            raise ValueError(f"Pushdown needs a SQL source, not {source!r}")
+        self.store = WarehouseCatalog(source)
+        self.cube = WarehouseCube(source, self.store)
+        # The normals would need a scan of the whole table, which pushdown avoids
+        self.climatology = None
+        self.version = self.store.version
+        self.origin = repr(source)
+        self.snapshot = None
+        self.loaded_at = datetime.datetime.now(datetime.timezone.utc)
+        # The warehouse keeps no load time, and backfills and corrections
+        # change the version without a newer date. catalog_refresh only
+        # publishes a catalog whose version changed, so when it was read
+        # moves exactly when the data does.
+        self.modified = self.loaded_at.replace(microsecond=0)
+
+    def describe(self):
+        return {
+            "version": self.version,
+            "origin": self.origin,
+            "mode": "pushdown",
+            "snapshot": None,
+            "rows": len(self.store),
+            "date_min": self.store.date_min.isoformat(),
+            "date_max": self.store.date_max.isoformat(),
+            "loaded_at": self.loaded_at.isoformat(timespec="seconds"),
+            "modified": self.modified.isoformat(),
+        }
+
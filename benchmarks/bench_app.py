@@ -0,0 +1,216 @@
+"""Benchmark the app's hot paths on a synthetic extract and save a comparable report.
+
+    python benchmarks/bench_app.py [--municipios 400] [--years 14] [--data FILE]
+                                   [--output report.json] [--compare baseline.json]
+
+Times the load and cleaning of the table, building the store, the rollup
+cube and the climatology, importing app.py, ``set_cities_options`` and
+``update_graph`` per aggregation level (cold and cached) and the patch it
+sends when only the variable changes, the departamento and anomaly views,
+and records the serialized figure and patch sizes and peak memory. The
+report is JSON stamped with the git commit; with ``--compare`` the new
+numbers are printed next to an older report's.
+"""
+import argparse
+import datetime
+import importlib
+import json
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.join(HERE, os.pardir, "app")
+sys.path.insert(0, APP_DIR)
+sys.path.insert(0, HERE)
+
+import synthetic  # noqa: E402
+
+AGGREGATIONS = ["D", "W", "M", "Q", "A"]
+SELECTIONS = [("ANTIOQUIA", "MEDELLÍN"), ("NARIÑO", "LA UNIÓN"), ("SAN ANDRES Y PROVIDENCIA", "SAN ANDRÉS")]
+
+
+def timed(fn, repeat):
+    """Median wall time of ``fn()`` in ms, and its last result."""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples) * 1000, result
+
+
+def traced_peak(fn):
+    """Peak traced allocation in MB while ``fn()`` runs."""
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1] / 2**20
+    finally:
+        tracemalloc.stop()
+
+
+def git_commit():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=HERE, capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=HERE, capture_output=True, text=True).stdout.strip()
+        return commit + ("-dirty" if dirty else "")
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def dataset_file(args):
+    if args.data:
+        return args.data
+    path = os.path.join(tempfile.gettempdir(), f"weather-bench-{args.municipios}x{args.years}-{args.seed}.parquet")
+    if not os.path.exists(path):
+        synthetic.write(synthetic.generate(args.municipios, args.years, args.seed), path)
+    return path
+
+
+def bench_load(metrics, source, repeat):
+    from store import TemperatureStore
+    from cube import RollupCube
+    from climatology import Climatology
+
+    metrics["load.read_clean_ms"], frame = timed(source.read, repeat)
+    metrics["store.build_ms"], store = timed(lambda: TemperatureStore(frame), repeat)
+    metrics["cube.build_ms"], cube = timed(lambda: RollupCube(store), repeat)
+    metrics["climatology.build_ms"], _ = timed(lambda: Climatology(cube), repeat)
+    metrics["load.rows"] = len(frame)
+    metrics["store.memory_mb"] = store.memory_usage() / 2**20
+    metrics["load.peak_traced_mb"] = traced_peak(lambda: RollupCube(TemperatureStore(source.read())))
+
+
+def bench_app(metrics, app, repeat):
+    data = app.live.current
+    departamentos = data.store.departamentos
+    metrics["set_cities_options.ms"], _ = timed(lambda: [app.set_cities_options(d) for d in departamentos], repeat)
+    metrics["set_cities_options.ms"] /= len(departamentos)
+
+    start, end = "2017-01-01", str(data.store.date_max.date())
+    for aggregation in AGGREGATIONS:
+        cold, warm, sizes, patched, patch_sizes, grids, grid_sizes, anomalies, anomaly_sizes = [], [], [], [], [], [], [], [], []
+        for departamento, municipio in SELECTIONS:
+            args = (aggregation, departamento, municipio, start, end, "temp_max")
+
+            def cold_call():
+                app.figure_cache.clear()
+                return app.update_graph(*args)
+
+            def patch():
+                return app.patch_figure(data.cube, aggregation, departamento, municipio, start, end, "temp_min")
+
+            cold.append(timed(cold_call, repeat)[0])
+            warm.append(timed(lambda: app.update_graph(*args), repeat)[0])
+            sizes.append(len(json.dumps(app.update_graph(*args)[0])))
+            patched.append(timed(patch, repeat)[0])
+            patch_sizes.append(len(json.dumps(patch().to_plotly_json())))
+
+            def departamento_call():
+                app.figure_cache.clear()
+                return app.update_graph(*args, "departamento")
+
+            grids.append(timed(departamento_call, repeat)[0])
+            grid_sizes.append(len(json.dumps(departamento_call()[0])))
+
+            def anomaly_call():
+                app.figure_cache.clear()
+                return app.update_graph(*args, "anomalia")
+
+            anomalies.append(timed(anomaly_call, repeat)[0])
+            anomaly_sizes.append(len(json.dumps(anomaly_call()[0])))
+        metrics[f"update_graph.{aggregation}.cold_ms"] = statistics.median(cold)
+        metrics[f"update_graph.{aggregation}.cached_ms"] = statistics.median(warm)
+        metrics[f"update_graph.{aggregation}.patch_ms"] = statistics.median(patched)
+        metrics[f"figure.{aggregation}.bytes"] = statistics.median(sizes)
+        metrics[f"patch.{aggregation}.bytes"] = statistics.median(patch_sizes)
+        metrics[f"update_graph.{aggregation}.departamento_ms"] = statistics.median(grids)
+        metrics[f"departamento.{aggregation}.bytes"] = statistics.median(grid_sizes)
+        metrics[f"update_graph.{aggregation}.anomaly_ms"] = statistics.median(anomalies)
+        metrics[f"anomaly.{aggregation}.bytes"] = statistics.median(anomaly_sizes)
+
+
+def run(args):
+    path = dataset_file(args)
+    os.environ["WEATHER_DATA_SOURCE"] = path
+    os.environ.setdefault("WEATHER_REFRESH_ON_START", "0")
+    os.environ.setdefault("WEATHER_REFRESH_MINUTES", "0")
+    os.environ.pop("FIGURE_CACHE_DIR", None)
+    # Cold calls must stay cold: no figures built ahead in the background
+    os.environ["WEATHER_PREFETCH_WORKERS"] = "0"
+
+    metrics = {}
+    started = time.perf_counter()
+    app = importlib.import_module("app")
+    metrics["app.import_ms"] = (time.perf_counter() - started) * 1000
+
+    bench_app(metrics, app, args.repeat)
+    bench_load(metrics, app.source, max(1, args.repeat // 2))
+    metrics["process.max_rss_mb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+    import numpy
+    import pandas
+    import plotly
+    return {
+        "commit": git_commit(),
+        "created": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "packages": {"pandas": pandas.__version__, "numpy": numpy.__version__, "plotly": plotly.__version__},
+        "dataset": {"path": path, "municipios": args.municipios, "years": args.years, "seed": args.seed},
+        "repeat": args.repeat,
+        "metrics": metrics,
+    }
+
+
+def _scale(report):
+    return {key: value for key, value in report["dataset"].items() if key != "path"}
+
+
+def print_report(report, baseline=None):
+    title = f"commit {report['commit']}"
+    if baseline:
+        title += f" vs {baseline['commit']}"
+    print(title)
+    if baseline and _scale(baseline) != _scale(report):
+        print(f"note: the baseline was run on a different dataset: {_scale(baseline)}")
+    print(f"{'metric':<32} {'value':>12} {'baseline':>12} {'change':>9}")
+    for name, value in report["metrics"].items():
+        line = f"{name:<32} {value:12.3f}"
+        old = (baseline or {}).get("metrics", {}).get(name)
+        if old is not None:
+            change = f"{(value - old) / old * 100:+8.1f}%" if old else f"{'-':>9}"
+            line += f" {old:12.3f} {change}"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--municipios", type=int, default=400)
+    parser.add_argument("--years", type=int, default=14)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--data", help="use this extract instead of generating one")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", help="write the report as JSON here")
+    parser.add_argument("--compare", help="an earlier report to compare against")
+    args = parser.parse_args()
+
+    report = run(args)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+
+
+if __name__ == "__main__":
+    main()
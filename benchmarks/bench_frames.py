@@ -0,0 +1,68 @@
+"""Compare the cumulative animation frame builders as the series grows.
+
+    python benchmarks/bench_frames.py [--sizes 50 100 ...] [--legacy-max 2000]
+
+Prints, for each series length, the number of stacked rows and the median
+build time of the old copy-per-frame loop and of ``frames.cumulative_frames``.
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir, "app"))
+
+from frames import cumulative_frames  # noqa: E402
+
+
+def legacy_frames(df_temp):
+    df_temp = df_temp.copy()
+    df_temp['id'] = range(len(df_temp))
+    frames = []
+    for i in range(len(df_temp)):
+        frame = df_temp[df_temp['id'] <= i].copy()
+        frame['frame'] = i
+        frames.append(frame)
+    return pd.concat(frames)
+
+
+def make_series(n):
+    dates = pd.date_range("2000-01-31", periods=n, freq="D")
+    values = np.round(np.random.default_rng(0).uniform(10, 35, n), 1)
+    return pd.DataFrame({"date": dates, "temp_max": values})
+
+
+def timed(fn, series, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(series)
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[12, 52, 120, 365, 520, 1000, 2000, 3650])
+    parser.add_argument("--legacy-max", type=int, default=2000, help="skip the old loop above this length")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'points':>8} {'rows':>12} {'legacy ms':>12} {'vectorized ms':>14} {'speedup':>9}")
+    for n in args.sizes:
+        series = make_series(n)
+        vectorized = timed(cumulative_frames, series, args.repeat)
+        if n <= args.legacy_max:
+            legacy = timed(legacy_frames, series, max(1, args.repeat // 2))
+            legacy_text, speedup = f"{legacy:12.1f}", f"{legacy / vectorized:8.1f}x"
+        else:
+            legacy_text, speedup = f"{'-':>12}", f"{'-':>9}"
+        print(f"{n:8d} {n * (n + 1) // 2:12d} {legacy_text} {vectorized:14.2f} {speedup}")
+
+
+if __name__ == "__main__":
+    main()
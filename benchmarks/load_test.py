@@ -0,0 +1,237 @@
+"""Load-test the gunicorn deployment with 1, 2, 4... workers sharing one snapshot.
+
+    python benchmarks/load_test.py [--workers 1,2,4] [--threads 1] [--clients 8]
+                                   [--duration 20] [--municipios 400] [--years 14]
+                                   [--data FILE] [--output report.json]
+
+For each worker count, starts ``gunicorn -c gunicorn.conf.py app:server`` on
+the synthetic extract, waits until every worker answers /ready, then runs
+``--clients`` client processes for ``--duration`` seconds. Each client sends
+``update_graph`` requests through /_dash-update-component for random
+selections (so most miss the figure cache) and, in ``--export-share`` of the
+requests, an /api/v1/series download. Reports requests/second, latency
+percentiles, and RSS, PSS and private memory of every worker: RSS counts the
+mapped snapshot pages in every worker that touched them, PSS splits them
+between the workers sharing them, and private memory is what each worker
+really adds.
+"""
+import argparse
+import http.client
+import json
+import multiprocessing
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.parse
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.join(HERE, os.pardir, "app")
+sys.path.insert(0, HERE)
+
+from bench_app import dataset_file, git_commit  # noqa: E402
+
+INPUTS = [
+    ("aggregation-level", "value"), ("departamento-dropdown", "value"), ("municipio-dropdown", "value"),
+    ("date-picker-range", "start_date"), ("date-picker-range", "end_date"), ("variable-dropdown", "value"),
+    ("view-dropdown", "value"),
+]
+VARIABLES = ["temp_max", "temp_avg", "temp_min"]
+
+
+def get_json(port, path):
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+    try:
+        connection.request("GET", path)
+        response = connection.getresponse()
+        return response.status, json.loads(response.read() or "null")
+    finally:
+        connection.close()
+
+
+def update_graph_body(selection):
+    return json.dumps({
+        "output": "..figure-store.data...figure-skeleton.data..",
+        "outputs": [{"id": "figure-store", "property": "data"}, {"id": "figure-skeleton", "property": "data"}],
+        "inputs": [{"id": i, "property": p, "value": v} for (i, p), v in zip(INPUTS, selection)],
+        "state": [{"id": "figure-skeleton", "property": "data", "value": None}],
+        "changedPropIds": [],
+    })
+
+
+def random_request(rng, catalog, export_share):
+    departamento = rng.choice(list(catalog["departamentos"]))
+    municipio = rng.choice(catalog["departamentos"][departamento])
+    aggregation = rng.choice(["M", "Q", "A"])
+    variable = rng.choice(VARIABLES)
+    first, last = int(catalog["date_min"][:4]), int(catalog["date_max"][:4])
+    start = f"{rng.randint(first, max(first, last - 2))}-01-01"
+    end = catalog["date_max"]
+    if rng.random() < export_share:
+        query = urllib.parse.urlencode({
+            "departamento": departamento, "municipio": municipio, "aggregation": aggregation,
+            "variable": variable, "start": start, "end": end, "format": "csv"})
+        return "GET", f"/api/v1/series?{query}", None
+    selection = [aggregation, departamento, municipio, start, end, variable, "municipio"]
+    return "POST", "/_dash-update-component", update_graph_body(selection)
+
+
+def client(port, catalog, duration, export_share, seed):
+    """Send requests back to back for ``duration`` seconds; returns latencies (s) and error count."""
+    rng = random.Random(seed)
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+    latencies, errors = [], 0
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        method, path, body = random_request(rng, catalog, export_share)
+        started = time.perf_counter()
+        try:
+            connection.request(method, path, body=body, headers={"Content-Type": "application/json"} if body else {})
+            response = connection.getresponse()
+            response.read()
+            ok = response.status == 200
+        except (OSError, http.client.HTTPException):
+            connection.close()
+            connection = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+            ok = False
+        if ok:
+            latencies.append(time.perf_counter() - started)
+        else:
+            errors += 1
+    connection.close()
+    return latencies, errors
+
+
+def worker_pids(master):
+    pids = []
+    for name in os.listdir("/proc"):
+        if name.isdigit():
+            try:
+                with open(f"/proc/{name}/stat") as f:
+                    # The command may contain spaces; the ppid is the second field after it.
+                    if int(f.read().rsplit(")", 1)[1].split()[1]) == master:
+                        pids.append(int(name))
+            except (OSError, IndexError, ValueError):
+                pass
+    return sorted(pids)
+
+
+def memory_mb(pid):
+    """RSS, PSS and private memory of ``pid`` in MB, from smaps_rollup."""
+    fields = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == "kB":
+                fields[parts[0].rstrip(":")] = int(parts[1]) / 1024
+    return {
+        "rss": fields.get("Rss", 0.0),
+        "pss": fields.get("Pss", 0.0),
+        "private": fields.get("Private_Clean", 0.0) + fields.get("Private_Dirty", 0.0),
+    }
+
+
+def wait_ready(port, master, workers, timeout=300):
+    """Wait until every worker has published its dataset; returns the catalog."""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if master.poll() is not None:
+            raise RuntimeError(f"gunicorn exited with {master.returncode}")
+        if len(worker_pids(master.pid)) == workers:
+            try:
+                # Requests are spread over the workers, so ask a few times each.
+                statuses = [get_json(port, "/ready") for _ in range(4 * workers)]
+                if all(status == 200 and body["ready"] for status, body in statuses):
+                    return get_json(port, "/api/v1/catalog")[1]
+            except OSError:
+                pass
+        time.sleep(0.5)
+    raise RuntimeError("gunicorn did not become ready")
+
+
+def run_workers(args, data, snapshot_dir, workers):
+    env = dict(
+        os.environ,
+        WEATHER_DATA_SOURCE=data, WEATHER_SNAPSHOT_DIR=snapshot_dir,
+        WEATHER_WORKERS=str(workers), WEATHER_THREADS=str(args.threads), PORT=str(args.port),
+        WEATHER_REFRESH_ON_START="0", WEATHER_REFRESH_MINUTES="0", LOG_LEVEL="WARNING",
+    )
+    master = subprocess.Popen([sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "app:server"],
+                              cwd=APP_DIR, env=env)
+    try:
+        catalog = wait_ready(args.port, master, workers)
+        with multiprocessing.Pool(args.clients) as pool:
+            started = time.perf_counter()
+            results = pool.starmap(client, [(args.port, catalog, args.duration, args.export_share, seed)
+                                            for seed in range(args.clients)])
+            elapsed = time.perf_counter() - started
+        memory = {pid: memory_mb(pid) for pid in worker_pids(master.pid)}
+    finally:
+        master.terminate()
+        master.wait(timeout=60)
+
+    latencies = sorted(latency for result, _ in results for latency in result)
+    errors = sum(errors for _, errors in results)
+    quantile = lambda q: latencies[min(len(latencies) - 1, int(q * len(latencies)))] * 1000 if latencies else None
+    return {
+        "workers": workers,
+        "requests": len(latencies),
+        "errors": errors,
+        "requests_per_second": len(latencies) / elapsed,
+        "latency_p50_ms": quantile(0.5),
+        "latency_p95_ms": quantile(0.95),
+        "workers_mb": list(memory.values()),
+        "rss_mb_per_worker": statistics.mean(m["rss"] for m in memory.values()),
+        "pss_mb_total": sum(m["pss"] for m in memory.values()),
+        "private_mb_per_worker": statistics.mean(m["private"] for m in memory.values()),
+    }
+
+
+def print_report(report):
+    print(f"{report['data']}  clients={report['clients']} threads={report['threads']} "
+          f"duration={report['duration']}s cpus={report['cpus']}")
+    print(f"{'workers':>7} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'errors':>6} "
+          f"{'RSS/worker':>11} {'private/worker':>15} {'PSS total':>10}")
+    for run in report["runs"]:
+        print(f"{run['workers']:>7} {run['requests_per_second']:>8.1f} {run['latency_p50_ms'] or 0:>8.1f} "
+              f"{run['latency_p95_ms'] or 0:>8.1f} {run['errors']:>6} {run['rss_mb_per_worker']:>9.1f}MB "
+              f"{run['private_mb_per_worker']:>13.1f}MB {run['pss_mb_total']:>8.1f}MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", default="1,2,4", help="comma-separated worker counts")
+    parser.add_argument("--threads", type=int, default=1)
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=20)
+    parser.add_argument("--export-share", type=float, default=0.25)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--municipios", type=int, default=400)
+    parser.add_argument("--years", type=int, default=14)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--data", help="use this extract instead of generating one")
+    parser.add_argument("--output", help="write the report as JSON here")
+    args = parser.parse_args()
+
+    data = os.path.abspath(dataset_file(args))
+    report = {
+        "commit": git_commit(), "data": os.path.basename(data), "cpus": os.cpu_count(),
+        "clients": args.clients, "threads": args.threads, "duration": args.duration, "runs": [],
+    }
+    with tempfile.TemporaryDirectory() as snapshot_dir:
+        for workers in [int(n) for n in args.workers.split(",")]:
+            report["runs"].append(run_workers(args, data, snapshot_dir, workers))
+            print_report({**report, "runs": report["runs"][-1:]})
+
+    print()
+    print_report(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""Generate a synthetic colombian_temperature_data extract at any scale.
+
+    python benchmarks/synthetic.py OUT [--municipios 400] [--years 14] [--seed 0]
+
+OUT ends in .parquet, .csv or .db (SQLite), so the file can be passed
+straight to WEATHER_DATA_SOURCE. The table has the real schema: one row per
+station and day with ``date``, ``departamento``, ``municipio``,
+``temp_min``, ``temp_avg``, ``temp_max`` and ``precipitacion_total``. The
+names carry the dirty variants the loader cleans: padding whitespace and
+"SAN ANDRES Y  PROVIDENCIA" with two spaces. Some municipios have two
+stations, some readings are missing and a few are out of range.
+"""
+import argparse
+import os
+import sqlite3
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.csv as pacsv
+import pyarrow.parquet as pq
+
+
+# Real names first, so the app's defaults (ANTIOQUIA / MEDELLÍN) exist at any
+# scale; LA UNIÓN repeats across departamentos like it does in the real data.
+MUNICIPIOS = {
+    "ANTIOQUIA": ["MEDELLÍN", "BELLO", "ENVIGADO", "ITAGÜÍ", "RIONEGRO", "LA UNIÓN"],
+    "CUNDINAMARCA": ["BOGOTÁ", "SOACHA", "ZIPAQUIRÁ", "FUSAGASUGÁ"],
+    "VALLE DEL CAUCA": ["CALI", "PALMIRA", "BUGA", "LA UNIÓN"],
+    "ATLÁNTICO": ["BARRANQUILLA", "SOLEDAD", "MALAMBO"],
+    "BOLÍVAR": ["CARTAGENA", "MAGANGUÉ", "TURBACO"],
+    "SANTANDER": ["BUCARAMANGA", "FLORIDABLANCA", "BARRANCABERMEJA"],
+    "NARIÑO": ["PASTO", "IPIALES", "TUMACO", "LA UNIÓN"],
+    "BOYACÁ": ["TUNJA", "DUITAMA", "SOGAMOSO"],
+    "META": ["VILLAVICENCIO", "ACACÍAS", "GRANADA"],
+    "SAN ANDRES Y  PROVIDENCIA": ["SAN ANDRÉS", "PROVIDENCIA"],
+}
+PADDING = ["", " ", "  "]
+START_YEAR = 2010
+
+
+def municipio_list(n):
+    """``n`` (departamento, municipio) pairs, real ones first, then numbered fillers."""
+    pairs = [(dep, mun) for dep, muns in MUNICIPIOS.items() for mun in muns]
+    departamentos = list(MUNICIPIOS)
+    i = 0
+    while len(pairs) < n:
+        i += 1
+        pairs.append((departamentos[i % len(departamentos)], f"MUNICIPIO {i:04d}"))
+    return pairs[:n]
+
+
+def _padded(names, codes, rng):
+    """Names for ``codes`` with random leading/trailing whitespace, as Arrow strings."""
+    variants = [f"{left}{name}{right}" for name in names for left in PADDING for right in PADDING]
+    pick = codes * len(PADDING) ** 2 + rng.integers(0, len(PADDING) ** 2, len(codes))
+    return pa.DictionaryArray.from_arrays(pa.array(pick, pa.int32()), pa.array(variants)).cast(pa.string())
+
+
+def generate(municipios=400, years=14, seed=0, second_station_share=0.1,
+             missing_share=0.01, outlier_share=0.001) -> pa.Table:
+    rng = np.random.default_rng(seed)
+    pairs = municipio_list(municipios)
+    days = np.arange(np.datetime64(f"{START_YEAR}-01-01"), np.datetime64(f"{START_YEAR + years}-01-01"))
+
+    # Stations: every municipio has one, some have a second.
+    station_municipio = np.concatenate((
+        np.arange(len(pairs)),
+        np.flatnonzero(rng.random(len(pairs)) < second_station_share),
+    ))
+    n_stations, n_days = len(station_municipio), len(days)
+    station = np.repeat(np.arange(n_stations), n_days)
+    day = np.tile(np.arange(n_days), n_stations)
+    municipio = station_municipio[station]
+
+    # Warm lowlands and cool highlands, a yearly cycle, a slow trend and noise.
+    base = rng.uniform(8, 30, len(pairs))[municipio]
+    season = 1.5 * np.sin(2 * np.pi * day / 365.25 + rng.uniform(0, 2 * np.pi, n_stations)[station])
+    trend = 0.03 * day / 365.25
+    temp_avg = base + season + trend + rng.normal(0, 1.2, len(day))
+    temp_min = temp_avg - rng.uniform(3, 7, len(day))
+    temp_max = temp_avg + rng.uniform(3, 8, len(day))
+    precipitacion = rng.gamma(0.6, 8, len(day)) * (rng.random(len(day)) < 0.55)
+
+    measures = {"temp_min": temp_min, "temp_avg": temp_avg, "temp_max": temp_max, "precipitacion_total": precipitacion}
+    for values in measures.values():
+        values[rng.random(len(day)) < missing_share] = np.nan
+        outliers = rng.random(len(day)) < outlier_share
+        values[outliers] = rng.choice([-99.0, 60.0], outliers.sum())
+
+    departamentos = list(dict.fromkeys(dep for dep, _ in pairs))
+    dep_code = np.array([departamentos.index(dep) for dep, _ in pairs])[municipio]
+    return pa.table({
+        "date": pa.array(days[day].astype("datetime64[ns]")),
+        "departamento": _padded(departamentos, dep_code, rng),
+        "municipio": _padded([mun for _, mun in pairs], municipio, rng),
+        **{name: pa.array(np.round(values, 1)) for name, values in measures.items()},
+    })
+
+
+def write(table: pa.Table, path, table_name="colombian_temperature_data"):
+    extension = os.path.splitext(path)[1].lower()
+    if extension in (".parquet", ".pq"):
+        pq.write_table(table, path)
+    elif extension == ".csv":
+        pacsv.write_csv(table, path)
+    elif extension in (".db", ".sqlite", ".sqlite3"):
+        if os.path.exists(path):
+            os.unlink(path)
+        columns = table.column_names
+        with sqlite3.connect(path) as connection:
+            connection.execute(f"CREATE TABLE {table_name} (date TEXT, departamento TEXT, municipio TEXT, "
+                               "temp_min REAL, temp_avg REAL, temp_max REAL, precipitacion_total REAL)")
+            dates = table.column("date").cast(pa.date32()).cast(pa.string())
+            table = table.set_column(columns.index("date"), "date", dates)
+            for batch in table.to_batches(max_chunksize=100_000):
+                rows = zip(*(batch.column(name).to_pylist() for name in columns))
+                connection.executemany(f"INSERT INTO {table_name} VALUES ({', '.join('?' * len(columns))})", rows)
+    else:
+        raise ValueError(f"Cannot write {path!r}; use .parquet, .csv or .db")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("out")
+    parser.add_argument("--municipios", type=int, default=400)
+    parser.add_argument("--years", type=int, default=14)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    table = generate(args.municipios, args.years, args.seed)
+    write(table, args.out)
+    print(f"{args.out}: {table.num_rows} rows, {args.municipios} municipios x {args.years} years")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,42 @@
+import importlib
+import os
+
+import pytest
+
+import synthetic
+from datasource import ParquetSource
+
+
+@pytest.fixture(scope="session")
+def extract(tmp_path_factory):
+    """A small synthetic extract on disk, with the dirty names, gaps and outliers of the real table."""
+    path = tmp_path_factory.mktemp("data") / "weather.parquet"
+    synthetic.write(synthetic.generate(municipios=12, years=4, seed=1), str(path))
+    return str(path)
+
+
+@pytest.fixture(scope="session")
+def weather(extract):
+    """The extract as the loader cleans it."""
+    return ParquetSource(extract).read()
+
+
+@pytest.fixture(scope="session")
+def dash_app(extract, tmp_path_factory):
+    """app.py serving the extract, without background refreshes or prefetching."""
+    environment = {
+        "WEATHER_DATA_SOURCE": extract,
+        "WEATHER_REFRESH_MINUTES": "0",
+        "WEATHER_PREFETCH_WORKERS": "0",
+        "WEATHER_SELECTION_LOG": str(tmp_path_factory.mktemp("log") / "selections.json"),
+    }
+    saved = {name: os.environ.get(name) for name in environment}
+    os.environ.update(environment)
+    try:
+        yield importlib.import_module("app")
+    finally:
+        for name, value in saved.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
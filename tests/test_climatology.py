@@ -0,0 +1,59 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from climatology import MIN_YEARS, Climatology
+from cube import RollupCube
+from store import TemperatureStore
+
+
+# How each granularity groups its periods across years
+CALENDAR = {
+    "D": lambda dates: dates.dt.month,
+    "W": lambda dates: dates.dt.month,
+    "M": lambda dates: dates.dt.month,
+    "Q": lambda dates: dates.dt.quarter,
+    "A": lambda dates: np.zeros(len(dates), dtype=int),
+}
+
+
+@pytest.fixture(scope="module")
+def cube(weather):
+    return RollupCube(TemperatureStore(weather))
+
+
+@pytest.fixture(scope="module")
+def climatology(cube):
+    return Climatology(cube)
+
+
+@pytest.mark.parametrize("granularity", list(CALENDAR))
+@pytest.mark.parametrize("variable", ["temp_max", "precipitacion_total"])
+def test_baseline_summarizes_the_same_calendar_group(cube, climatology, granularity, variable):
+    series = cube.series(granularity, "ANTIOQUIA", "MEDELLÍN", variable, "2000-01-01", "2030-12-31")
+    baseline = climatology.baseline(granularity, "ANTIOQUIA", "MEDELLÍN", variable, series["date"])
+
+    calendar = CALENDAR[granularity](series["date"])
+    groups = series.groupby(calendar)[variable]
+    years = series["date"].dt.year.groupby(calendar).transform("nunique")
+    expected = pd.DataFrame({
+        "mean": groups.transform("mean"),
+        "std": groups.transform("std"),
+        **{f"p{q}": groups.transform(lambda values, q=q: values.quantile(q / 100)) for q in (10, 25, 50, 75, 90)},
+    }).where(years >= MIN_YEARS)
+
+    assert (years >= MIN_YEARS).any()
+    pd.testing.assert_frame_equal(baseline, expected.reset_index(drop=True), check_names=False)
+
+
+def test_periods_without_a_date_are_left_out(weather, climatology):
+    # A snapshot's table is taken as it is, so a NaT can reach the cube.
+    frame = TemperatureStore(weather).frame.copy()
+    frame.loc[0, "date"] = pd.NaT
+    undated = Climatology(RollupCube(TemperatureStore.from_sorted_frame(frame)))
+
+    dates = pd.Series(pd.to_datetime(["2012-03-31", "2012-06-30"]))
+    for granularity in CALENDAR:
+        expected = climatology.baseline(granularity, "CUNDINAMARCA", "BOGOTÁ", "temp_max", dates)
+        assert expected["mean"].notna().all()
+        pd.testing.assert_frame_equal(undated.baseline(granularity, "CUNDINAMARCA", "BOGOTÁ", "temp_max", dates), expected)
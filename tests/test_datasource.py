@@ -0,0 +1,86 @@
+import sqlite3
+
+import pandas as pd
+
+from datasource import SQLiteSource
+
+
+ROWS = [
+    # date, departamento, municipio, temp_min, temp_avg, temp_max, precipitacion_total
+    ("2020-01-01", "ANTIOQUIA", "MEDELLÍN", 15.0, 20.0, 25.0, 1.0),
+    ("2020-01-02", "ANTIOQUIA", "MEDELLÍN", 15.5, 20.5, 25.5, 0.0),
+    # A batch of two rows where temp_max and the precipitation are all NULL
+    ("2020-01-03", "ANTIOQUIA", "MEDELLÍN", 16.0, 21.0, None, None),
+    ("2020-01-04", " ANTIOQUIA", "MEDELLÍN ", 16.5, 21.5, None, None),
+    ("2021-01-01", "CALDAS", "MANIZALES", 12.0, 17.0, 22.0, 3.0),
+    ("2021-01-02", "CALDAS", "MANIZALES", 12.5, 17.5, 22.5, 2.0),
+]
+
+
+def sqlite_source(tmp_path, rows=ROWS):
+    path = tmp_path / "weather.db"
+    with sqlite3.connect(path) as connection:
+        connection.execute("CREATE TABLE colombian_temperature_data (date TEXT, departamento TEXT, municipio TEXT, "
+                           "temp_min REAL, temp_avg REAL, temp_max REAL, precipitacion_total REAL)")
+        connection.executemany("INSERT INTO colombian_temperature_data VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+    connection.close()
+    return SQLiteSource(str(path), batch_size=2)
+
+
+def test_read_with_an_all_null_batch(tmp_path):
+    frame = sqlite_source(tmp_path).read()
+
+    assert len(frame) == len(ROWS)
+    assert frame["temp_max"].isna().sum() == 2
+    assert frame["temp_max"].dtype == "float64"
+    assert set(frame["departamento"]) == {"ANTIOQUIA", "CALDAS"}
+
+
+def test_partitioned_read_with_an_all_null_batch(tmp_path):
+    source = sqlite_source(tmp_path)
+    source.load_workers = 2
+    for by in ("year", "departamento"):
+        source.partition_by = by
+        frame = source.read()
+        assert len(frame) == len(ROWS)
+        assert frame["temp_max"].isna().sum() == 2
+
+
+def test_read_since_with_an_all_null_batch(tmp_path):
+    frame = sqlite_source(tmp_path).read_since(pd.Timestamp("2019-12-31"))
+
+    assert len(frame) == len(ROWS)
+    assert frame["precipitacion_total"].isna().sum() == 2
+
+
+class CountingSQLiteSource(SQLiteSource):
+    """Counts the connections it opened that are still open."""
+
+    open_connections = 0
+
+    def connect(self):
+        source = self
+
+        class Connection:
+            def __init__(self, connection):
+                self._connection = connection
+                source.open_connections += 1
+
+            def __getattr__(self, name):
+                return getattr(self._connection, name)
+
+            def close(self):
+                source.open_connections -= 1
+                self._connection.close()
+
+        return Connection(super().connect())
+
+
+def test_partitioned_read_closes_its_connections(tmp_path):
+    sqlite_source(tmp_path)
+    source = CountingSQLiteSource(str(tmp_path / "weather.db"), batch_size=2)
+    source.load_workers = 2
+    for by in ("year", "departamento"):
+        source.partition_by = by
+        assert len(source.read()) == len(ROWS)
+        assert source.open_connections == 0
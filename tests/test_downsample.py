@@ -0,0 +1,65 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from downsample import _edges, downsample, lttb, minmax_envelope
+
+
+@pytest.fixture
+def series():
+    rng = np.random.default_rng(3)
+    x = np.arange(1000, dtype=np.float64) * 86400
+    y = np.sin(np.arange(1000) / 40) * 10 + rng.normal(0, 2, 1000)
+    return x, y
+
+
+@pytest.mark.parametrize("budget", [2, 3, 50, 101, 999])
+def test_minmax_keeps_each_buckets_extremes(series, budget):
+    x, y = series
+    picked = minmax_envelope(x, y, budget)
+
+    assert len(picked) <= budget
+    assert np.all(np.diff(picked) > 0)
+    edges = _edges(len(y), max(1, budget // 2))
+    for start, stop in zip(edges[:-1], edges[1:]):
+        kept = y[picked[(picked >= start) & (picked < stop)]]
+        assert kept.min() == y[start:stop].min() and kept.max() == y[start:stop].max()
+
+
+def test_minmax_returns_everything_within_budget(series):
+    x, y = series
+    assert np.array_equal(minmax_envelope(x, y, len(y)), np.arange(len(y)))
+
+
+@pytest.mark.parametrize("budget", [3, 10, 100, 500])
+def test_lttb_picks_the_largest_triangle_of_each_bucket(series, budget):
+    x, y = series
+    picked = lttb(x, y, budget)
+
+    assert len(picked) == budget
+    assert picked[0] == 0 and picked[-1] == len(y) - 1
+    assert np.all(np.diff(picked) > 0)
+    # One point per bucket of the inner points, the one spanning the largest
+    # triangle with the means of the buckets around it.
+    edges = _edges(len(y) - 2, budget - 2) + 1
+    means = [(x[0], y[0])] + [(x[a:b].mean(), y[a:b].mean()) for a, b in zip(edges[:-1], edges[1:])] + [(x[-1], y[-1])]
+    for i, (start, stop) in enumerate(zip(edges[:-1], edges[1:])):
+        (ax, ay), (cx, cy) = means[i], means[i + 2]
+        area = np.abs((ax - cx) * (y[start:stop] - ay) - (ax - x[start:stop]) * (cy - ay))
+        assert picked[i + 1] == start + np.argmax(area)
+
+
+def test_downsample_keeps_date_order_and_budget():
+    frame = pd.DataFrame({"date": pd.date_range("2010-01-01", periods=5000, freq="D"),
+                          "temp_max": np.random.default_rng(0).normal(25, 3, 5000)})
+    for method in ("minmax", "lttb"):
+        reduced = downsample(frame, "temp_max", 300, method)
+        assert len(reduced) <= 300
+        assert reduced["date"].is_monotonic_increasing
+        assert len(downsample(frame, "temp_max", 1, method)) <= 3
+
+    envelope = downsample(frame, "temp_max", 300)
+    assert envelope["temp_max"].max() == frame["temp_max"].max()
+    assert envelope["temp_max"].min() == frame["temp_max"].min()
+    assert downsample(frame, "temp_max", 0) is frame
+    assert downsample(frame, "temp_max", len(frame)) is frame
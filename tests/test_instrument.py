@@ -0,0 +1,23 @@
+from instrument import PAYLOAD_BYTES
+
+
+def payload_observations(callback):
+    samples = {name: value for name, labels, value in PAYLOAD_BYTES.samples() if ("callback", callback) in labels}
+    return samples.get(f"{PAYLOAD_BYTES.name}_count", 0), samples.get(f"{PAYLOAD_BYTES.name}_sum", 0.0)
+
+
+def test_payload_size_is_recorded_on_cache_hits(dash_app):
+    args = ("M", "ANTIOQUIA", "MEDELLÍN", "2011-01-01", "2013-12-31", "temp_max")
+    dash_app.figure_cache.clear()
+    count, total = payload_observations("update_graph")
+
+    dash_app.update_graph(*args)
+    missed = payload_observations("update_graph")
+    hits = dash_app.figure_cache.stats()["hits"]
+    dash_app.update_graph(*args)
+    hit = payload_observations("update_graph")
+
+    assert dash_app.figure_cache.stats()["hits"] == hits + 1
+    assert missed[0] == count + 1 and hit[0] == count + 2
+    # The hit sends the same figure the miss built.
+    assert hit[1] - missed[1] == missed[1] - total > 0
@@ -0,0 +1,44 @@
+import pyarrow.parquet as pq
+import pytest
+
+import synthetic
+from datasource import ParquetSource, SQLiteSource
+from store import TemperatureStore
+
+
+@pytest.fixture(scope="module")
+def table():
+    return synthetic.generate(municipios=12, years=4, seed=2)
+
+
+@pytest.fixture(scope="module")
+def serial_version(table, tmp_path_factory):
+    path = tmp_path_factory.mktemp("serial") / "weather.parquet"
+    synthetic.write(table, str(path))
+    return TemperatureStore(ParquetSource(str(path)).read()).version
+
+
+@pytest.mark.parametrize("by", ["year", "departamento"])
+def test_partitioned_sql_load_keeps_the_serial_version(table, serial_version, tmp_path, by):
+    path = tmp_path / "weather.db"
+    synthetic.write(table, str(path))
+    source = SQLiteSource(str(path), batch_size=5000)
+    source.partition_by, source.load_workers = by, 4
+
+    assert TemperatureStore(source.read()).version == serial_version
+
+
+def test_row_group_load_keeps_the_serial_version(table, serial_version, tmp_path):
+    path = tmp_path / "weather.parquet"
+    pq.write_table(table, path, row_group_size=4000)
+    source = ParquetSource(str(path))
+    source.partition_by, source.load_workers = "year", 4
+
+    assert len(source.partitions("year")) > 1
+    assert TemperatureStore(source.read()).version == serial_version
+
+
+def test_shuffled_rows_keep_the_version(weather):
+    shuffled = weather.sample(frac=1, random_state=0).reset_index(drop=True)
+
+    assert TemperatureStore(shuffled).version == TemperatureStore(weather).version
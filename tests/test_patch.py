@@ -0,0 +1,72 @@
+import copy
+
+import pytest
+
+
+INPUTS = [("aggregation-level", "value"), ("departamento-dropdown", "value"), ("municipio-dropdown", "value"),
+          ("date-picker-range", "start_date"), ("date-picker-range", "end_date"), ("variable-dropdown", "value"),
+          ("view-dropdown", "value")]
+
+
+@pytest.fixture(scope="module")
+def update(dash_app):
+    client = dash_app.server.test_client()
+    client.get("/")
+
+    def update(selection, changed=(), skeleton=None):
+        """update_graph's response through Dash, as the browser would get it."""
+        body = {
+            "output": "..figure-store.data...figure-skeleton.data..",
+            "outputs": [{"id": "figure-store", "property": "data"}, {"id": "figure-skeleton", "property": "data"}],
+            "inputs": [{"id": i, "property": p, "value": v} for (i, p), v in zip(INPUTS, [*selection, "municipio"])],
+            "state": [{"id": "figure-skeleton", "property": "data", "value": skeleton}],
+            "changedPropIds": list(changed),
+        }
+        response = client.post("/_dash-update-component", json=body)
+        assert response.status_code == 200
+        return response.get_json()["response"]
+
+    return update
+
+
+def apply(figure, patch):
+    figure = copy.deepcopy(figure)
+    for operation in patch["operations"]:
+        assert operation["operation"] == "Assign"
+        *path, last = operation["location"]
+        target = figure
+        for part in path:
+            target = target[part]
+        target[last] = operation["params"]["value"]
+    return figure
+
+
+@pytest.mark.parametrize("aggregation", ["D", "W", "M", "Q", "A"])
+@pytest.mark.parametrize("changed, position, value", [
+    ("date-picker-range.start_date", 3, "2011-05-01"),
+    ("variable-dropdown.value", 5, "temp_min"),
+    # From °C to mm, so the unit labels change too
+    ("variable-dropdown.value", 5, "precipitacion_total"),
+])
+def test_patch_matches_a_full_rebuild(dash_app, update, aggregation, changed, position, value):
+    selection = [aggregation, "ANTIOQUIA", "MEDELLÍN", "2010-01-01", "2013-12-31", "temp_max"]
+    first = update(selection)
+    figure, skeleton = first["figure-store"]["data"], first["figure-skeleton"]["data"]
+    selection[position] = value
+
+    patched = update(selection, [changed], skeleton)
+    assert patched["figure-store"]["data"]["__dash_patch_update"]
+    assert "figure-skeleton" not in patched
+
+    dash_app.figure_cache.clear()
+    rebuilt = update(selection)["figure-store"]["data"]
+    assert apply(figure, patched["figure-store"]["data"]) == rebuilt
+
+
+def test_new_municipio_gets_a_full_figure(update):
+    first = update(["M", "ANTIOQUIA", "MEDELLÍN", "2010-01-01", "2013-12-31", "temp_max"])
+    response = update(["M", "ANTIOQUIA", "BELLO", "2010-01-01", "2013-12-31", "temp_max"],
+                      ["municipio-dropdown.value"], first["figure-skeleton"]["data"])
+
+    assert "layout" in response["figure-store"]["data"]
+    assert response["figure-skeleton"]["data"] == ["M", "ANTIOQUIA", "BELLO"]
@@ -0,0 +1,35 @@
+import pandas as pd
+import pytest
+
+from cube import RollupCube
+from dataset import Dataset
+from store import TemperatureStore
+
+
+@pytest.mark.parametrize("cutoff", ["2011-06-15", "2013-12-31"])
+def test_append_matches_a_full_rebuild(weather, cutoff):
+    older = weather[weather["date"] <= cutoff]
+    newer = weather[weather["date"] > cutoff]
+
+    appended = Dataset(TemperatureStore(older), origin="test").append(newer)
+    rebuilt = Dataset(TemperatureStore(weather), origin="test")
+
+    assert appended.version == rebuilt.version
+    pd.testing.assert_frame_equal(appended.store.frame, rebuilt.store.frame)
+    assert appended.store.offsets == rebuilt.store.offsets
+    assert appended.cube.keys == rebuilt.cube.keys
+    for granularity, table in rebuilt.cube.tables.items():
+        pd.testing.assert_frame_equal(appended.cube.tables[granularity]["frame"], table["frame"])
+
+
+def test_append_adds_new_municipios(weather):
+    # A municipio first reported after the cutoff shifts the keys after it.
+    late = weather["municipio"] == "BELLO"
+    older = weather[~late & (weather["date"] <= "2012-12-31")]
+
+    appended = Dataset(TemperatureStore(older), origin="test").append(weather[weather["date"] > "2012-12-31"])
+    rebuilt = RollupCube(TemperatureStore(weather[~late | (weather["date"] > "2012-12-31")]))
+
+    assert appended.cube.keys == rebuilt.keys
+    for granularity, table in rebuilt.tables.items():
+        pd.testing.assert_frame_equal(appended.cube.tables[granularity]["frame"], table["frame"])
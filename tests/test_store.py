@@ -0,0 +1,64 @@
+import numpy as np
+import pandas as pd
+
+from cube import RollupCube
+from store import TemperatureStore
+
+
+def frame(rows):
+    return pd.DataFrame(rows, columns=["date", "departamento", "municipio", "temp_min", "temp_avg",
+                                       "temp_max", "precipitacion_total"]).astype({"date": "datetime64[ns]"})
+
+
+ROWS = [
+    ("2020-01-01", "ANTIOQUIA", "MEDELLÍN", 15.0, 20.0, 25.0, 1.0),
+    ("2020-01-02", "ANTIOQUIA", "MEDELLÍN", 15.5, 20.5, 25.5, 0.0),
+    ("2020-01-01", "ANTIOQUIA", "BELLO", 14.0, 19.0, 24.0, 2.0),
+    ("2020-01-01", "CALDAS", "MANIZALES", 12.0, 17.0, 22.0, 3.0),
+]
+INCOMPLETE = [
+    ("2020-01-03", None, "MEDELLÍN", 16.0, 21.0, 26.0, 0.0),
+    ("2020-01-03", "ANTIOQUIA", None, 16.0, 21.0, 26.0, 0.0),
+    (None, "CALDAS", "MANIZALES", 13.0, 18.0, 23.0, 1.0),
+    ("2019-06-01", None, None, 10.0, 11.0, 12.0, 0.0),
+]
+
+
+def test_rows_missing_a_key_or_a_date_are_left_out():
+    store = TemperatureStore(frame(ROWS + INCOMPLETE))
+
+    assert len(store) == len(ROWS)
+    assert store.version == TemperatureStore(frame(ROWS)).version
+    assert store.municipios_by_departamento == {"ANTIOQUIA": ["BELLO", "MEDELLÍN"], "CALDAS": ["MANIZALES"]}
+    # Every row is in exactly one municipio's block.
+    covered = sorted(i for start, stop in store.offsets.values() for i in range(start, stop))
+    assert covered == list(range(len(store)))
+    assert store.date_min == pd.Timestamp("2020-01-01")
+    assert store.date_max == pd.Timestamp("2020-01-02")
+    assert len(RollupCube(store).series("M", "ANTIOQUIA", "MEDELLÍN", "temp_max", "2020-01-01", "2020-12-31")) == 1
+
+
+def test_append_leaves_out_rows_missing_a_key_or_a_date():
+    store = TemperatureStore(frame(ROWS))
+    later = [("2020-01-05", "ANTIOQUIA", "MEDELLÍN", 16.0, 21.0, 26.0, 0.0)]
+    # The same incomplete rows, dated after the store where they have a date
+    incomplete = [("2020-01-06", *row[1:]) if row[0] else row for row in INCOMPLETE]
+    appended = store.append(frame(later + incomplete))
+
+    assert len(appended) == len(ROWS) + 1
+    assert appended.municipios_by_departamento == store.municipios_by_departamento
+    assert appended.date_max == pd.Timestamp("2020-01-05")
+    assert np.array_equal(appended.municipio("ANTIOQUIA", "MEDELLÍN")["temp_max"], [25.0, 25.5, 26.0])
+
+
+def test_dataset_append_rolls_up_only_the_complete_rows():
+    from dataset import Dataset
+
+    dataset = Dataset(TemperatureStore(frame(ROWS)), origin="test")
+    later = [("2020-02-01", "ANTIOQUIA", "MEDELLÍN", 16.0, 21.0, 26.0, 0.0)]
+    incomplete = [("2020-02-02", *row[1:]) if row[0] else row for row in INCOMPLETE]
+    appended = dataset.append(frame(later + incomplete))
+
+    rebuilt = RollupCube(appended.store)
+    for granularity, table in appended.cube.tables.items():
+        pd.testing.assert_frame_equal(table["frame"], rebuilt.tables[granularity]["frame"])
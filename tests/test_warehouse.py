@@ -0,0 +1,58 @@
+import datetime
+import sqlite3
+
+import pytest
+
+import warehouse
+from dataset import LiveDataset, catalog_refresh
+from datasource import SQLiteSource
+from test_datasource import ROWS, sqlite_source
+
+
+class Clock:
+    """Stands in for the datetime module in warehouse, with a ``now`` the test moves."""
+
+    timezone = datetime.timezone
+
+    def __init__(self):
+        clock = self
+        self.now = datetime.datetime(2024, 1, 1, 12, tzinfo=datetime.timezone.utc)
+
+        class Datetime(datetime.datetime):
+            @classmethod
+            def now(cls, tz=None):
+                return clock.now
+
+        self.datetime = Datetime
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(warehouse, "datetime", clock)
+    return clock
+
+
+def test_last_modified_moves_with_a_backfill(tmp_path, clock):
+    source = sqlite_source(tmp_path)
+    live = LiveDataset()
+    live.publish(warehouse.WarehouseDataset(source))
+    first = live.current
+
+    # Same data: nothing is published and Last-Modified stays.
+    clock.now += datetime.timedelta(minutes=1)
+    catalog_refresh(live, source)
+    assert live.current is first
+
+    # A correction older than the newest date still changes the version.
+    with sqlite3.connect(tmp_path / "weather.db") as connection:
+        connection.execute("INSERT INTO colombian_temperature_data VALUES (?, ?, ?, ?, ?, ?, ?)",
+                           ("2020-01-05", "ANTIOQUIA", "MEDELLÍN", 16.0, 21.0, 26.0, 0.0))
+    connection.close()
+    clock.now += datetime.timedelta(minutes=1)
+    catalog_refresh(live, SQLiteSource(source.path, batch_size=2))
+
+    assert live.current.version != first.version
+    assert live.current.store.date_max == first.store.date_max
+    assert live.current.modified > first.modified
+    assert len(live.current.store) == len(ROWS) + 1